@@ -1,46 +1,94 @@
 import abc
 import collections
-from itertools import groupby
+from copy import deepcopy
+from functools import partial
+import json
+from multiprocessing.pool import ThreadPool
+from operator import itemgetter
+import os
+import threading
 
 from graphql import GraphQLError, GraphQLField, GraphQLInputObjectField, GraphQLNonNull, GraphQLObjectType, GraphQLList, GraphQLSchema
 from graphql.execution import execute as graphql_execute, ExecutionResult
 from graphql.execution.values import get_variable_values
-from graphql.language import ast as ast_types
 from graphql.language.parser import parse
+from graphql.language.printer import print_ast
 from graphql.validation import validate
 import six
 
-from .requests import request_from_graphql_ast, request_from_graphql_document, Request, field_key
+from .costs import QueryLimits
+from .requests import get_operation, request_from_graphql_ast, request_from_graphql_document, Request, field_key
 from .schemas import is_subtype
-from .util import partition, unique
-
-
-def executor(root, mutation=None):
+from .util import find, partition, unique
+
+
+def executor(
+    root,
+    mutation=None,
+    response_cache=None,
+    response_cache_key=None,
+    document_cache=None,
+    max_cost=None,
+    max_depth=None,
+    default_list_size=10,
+    max_rows=None,
+    max_rows_per_fetch=None,
+    fetch_concurrency=None,
+):
+    _prepare(root)
     if mutation is None:
         mutation_type = None
     else:
+        _prepare(mutation)
         mutation_type = _nullable(mutation.to_graphql_type())
 
+    if response_cache_key is None:
+        response_cache_key = lambda context: None
+
+    limits = QueryLimits(
+        max_cost=max_cost,
+        max_depth=max_depth,
+        default_list_size=default_list_size,
+        max_rows=max_rows,
+        max_rows_per_fetch=max_rows_per_fetch,
+    )
+
+    if fetch_concurrency is None:
+        pool = None
+    else:
+        pool = _FetchPool(fetch_concurrency)
+
     default_schema = GraphQLSchema(
         query=_nullable(root.to_graphql_type()),
         mutation=mutation_type,
     )
 
-    def execute(query, variables=None, context=None, schema=None):
+    def execute(query, variables=None, context=None, schema=None, operation_name=None):
+        operation = {"query": query, "variables": variables, "operationName": operation_name}
+        result, = execute_batch([operation], context=context, schema=schema)
+        return result
+
+    def execute_batch(operations, context=None, schema=None):
         if schema is None:
             schema = default_schema
         elif not is_subtype(default_schema, schema):
             raise ValueError("schema argument must be superschema of main schema")
 
-        return _execute(
+        return _execute_batch(
             schema=schema,
             root=root,
             mutation=mutation,
-            query=query,
-            variables=variables,
+            operations=operations,
             context=context,
+            response_cache=response_cache,
+            response_cache_key=response_cache_key,
+            document_cache=document_cache,
+            limits=limits,
+            pool=pool,
         )
 
+    execute.batch = execute_batch
+
     return execute
 
 
@@ -48,52 +96,286 @@ def execute(root, *args, **kwargs):
     return executor(root)(*args, **kwargs)
 
 
-def _execute(schema, root, query, context=None, variables=None, mutation=None):
+def _prepare(root):
+    # Fields, including internal fields that never appear in the schema,
+    # are normally generated on first use. Generating them up front means
+    # that an executor created before forking is fully built and shared by
+    # the forked workers, rather than being rebuilt in each worker.
+    seen = set()
+    values = [root]
+
+    while values:
+        value = values.pop()
+        if value not in seen:
+            seen.add(value)
+            if isinstance(value, ScalarJoinType):
+                values.append(value._target)
+            value.join_fields()
+            for field in six.itervalues(value.fields()):
+                if field.target is not None:
+                    values.append(field.target)
+
+
+def _execute_batch(schema, root, operations, context, mutation, response_cache, response_cache_key, document_cache, limits, pool):
+    # Consecutive queries are fetched together so that they share fetches of
+    # the same relationships. Mutations are executed separately and in order,
+    # since later operations may depend on their effects.
+    results = [None] * len(operations)
+    queries = []
+
+    def execute_queries():
+        for index, result in _execute_operations(schema, root, queries, response_cache, limits, pool):
+            results[index] = result
+        del queries[:]
+
+    for index, operation in enumerate(operations):
+        prepared = _prepare_operation(
+            schema=schema,
+            root=root,
+            mutation=mutation,
+            query=operation["query"],
+            variables=operation.get("variables"),
+            operation_name=operation.get("operationName"),
+            context=context,
+            response_cache=response_cache,
+            response_cache_key=response_cache_key,
+            document_cache=document_cache,
+            limits=limits,
+        )
+
+        if isinstance(prepared, ExecutionResult):
+            results[index] = prepared
+        elif prepared.is_mutation:
+            execute_queries()
+            (_, results[index]), = _execute_operations(schema, root, [(index, prepared)], response_cache, limits, pool)
+        else:
+            queries.append((index, prepared))
+
+    execute_queries()
+    return results
+
+
+class _PreparedOperation(object):
+    def __init__(self, request, operation_name, variable_values, is_mutation, cache_key, context):
+        self.request = request
+        self.operation_name = operation_name
+        self.variable_values = variable_values
+        self.is_mutation = is_mutation
+        self.cache_key = cache_key
+        self.context = context
+
+
+def _prepare_operation(schema, root, query, context, variables, operation_name, mutation, response_cache, response_cache_key, document_cache, limits):
     if variables is None:
         variables = {}
 
     try:
-        ast = parse(query)
-
-        validation_errors = validate(schema, ast)
+        ast, validation_errors = _parse_and_validate(schema, query, document_cache)
         if validation_errors:
             return ExecutionResult(
                 errors=validation_errors,
                 invalid=True,
             )
 
-        variable_definitions = [
-            variable_definition
-            for definition in ast.definitions
-            if isinstance(definition, ast_types.OperationDefinition)
-            for variable_definition in (definition.variable_definitions or [])
-        ]
-        variable_values = get_variable_values(schema, variable_definitions, variables)
-
-        # The Python implementation of GraphQL currently lacks support
-        # for nulls, so we use the uncoerced variables when handling the
-        # request.
-        #
-        # See: https://github.com/graphql-python/graphql-core/issues/118
-        request = request_from_graphql_document(ast, root, mutation_root=mutation, context=context, variables=variables)
-        data = root.fetch(request.query, None)[0].value
-
-        if request.schema_query is not None:
-            schema_result = graphql_execute(
+        operation = get_operation(ast, operation_name)
+        is_mutation = operation.operation == "mutation"
+        if response_cache is None or is_mutation:
+            cache_key = None
+        else:
+            cache_key = (
                 schema,
-                request.schema_query,
-                variable_values=variable_values,
+                print_ast(ast),
+                operation_name,
+                json.dumps(variables, sort_keys=True),
+                response_cache_key(context),
             )
-            if schema_result.invalid:
-                return schema_result
-
-            data.update(schema_result.data)
-
-        return ExecutionResult(data=data, errors=None)
+            data = response_cache.get(cache_key)
+            if data is not None:
+                return ExecutionResult(data=deepcopy(data), errors=None)
+
+        request, variable_values = _request_from_document(
+            schema,
+            ast,
+            root,
+            context=context,
+            variables=variables,
+            operation_name=operation_name,
+            mutation=mutation,
+        )
+        limits.check(request.query)
+        return _PreparedOperation(
+            request=request,
+            operation_name=operation_name,
+            variable_values=variable_values,
+            is_mutation=is_mutation,
+            cache_key=cache_key,
+            context=context,
+        )
     except GraphQLError as error:
         return ExecutionResult(errors=[error], invalid=True)
 
 
+def _parse_and_validate(schema, query, document_cache):
+    if document_cache is None:
+        cache_key = None
+    else:
+        cache_key = (schema, query)
+        document = document_cache.get(cache_key)
+        if document is not None:
+            return document
+
+    ast = parse(query)
+    document = (ast, validate(schema, ast))
+    if cache_key is not None:
+        document_cache.set(cache_key, document)
+    return document
+
+
+def _execute_operations(schema, root, operations, response_cache, limits, pool):
+    if len(operations) == 0:
+        return []
+
+    if len(operations) == 1:
+        (index, operation), = operations
+        try:
+            if operation.is_mutation:
+                data = _fetch_mutation(root, operation.request.query, row_counter=limits.row_counter())
+            else:
+                data = root.fetch(operation.request.query, None, row_counter=limits.row_counter(), pool=pool)[0].value
+        except GraphQLError as error:
+            return [(index, ExecutionResult(errors=[error], invalid=True))]
+        return [(index, _complete_operation(schema, operation, data, response_cache))]
+
+    try:
+        data = root.fetch(_combine_requests(operations), None, row_counter=limits.row_counter(), pool=pool)[0].value
+    except GraphQLError:
+        # Execute each operation separately so that the error is only
+        # reported for the operations that caused it
+        return [
+            result
+            for operation in operations
+            for result in _execute_operations(schema, root, [operation], response_cache, limits, pool)
+        ]
+
+    return [
+        (index, _complete_operation(
+            schema,
+            operation,
+            dict(
+                (selection.key, data[_batch_key(index, selection.key)])
+                for selection in operation.request.query.selections
+            ),
+            response_cache,
+        ))
+        for index, operation in operations
+    ]
+
+
+def _fetch_mutation(root, request, row_counter):
+    # Each mutation field, including its sub-selections, is fetched to
+    # completion before the next one starts, as GraphQL requires. Aliases of
+    # the same mutation field are therefore never combined into a single
+    # fetch, so each mutation happens once for each time it's selected.
+    # Mutations never use the pool, so nothing is fetched concurrently.
+    data = {}
+    for selection in request.selections:
+        data.update(root.fetch(request.copy(selections=[selection]), None, row_counter=row_counter)[0].value)
+    return data
+
+
+def _combine_requests(operations):
+    first_request = operations[0][1].request.query
+    return first_request.copy(selections=[
+        selection.copy(key=_batch_key(index, selection.key))
+        for index, operation in operations
+        for selection in operation.request.query.selections
+    ])
+
+
+def _batch_key(index, key):
+    # GraphQL response keys can't contain colons, so batch keys never
+    # clash with the keys of a single operation.
+    return "{}:{}".format(index, key)
+
+
+def _complete_operation(schema, operation, data, response_cache):
+    request = operation.request
+    if request.schema_query is not None:
+        schema_result = graphql_execute(
+            schema,
+            request.schema_query,
+            variable_values=operation.variable_values,
+            operation_name=operation.operation_name,
+        )
+        if schema_result.invalid:
+            return schema_result
+
+        data.update(schema_result.data)
+
+    if operation.cache_key is not None:
+        response_cache.set(operation.cache_key, deepcopy(data), tags=_type_names(request.query))
+    elif operation.is_mutation:
+        _invalidate(request.query, context=operation.context, response_cache=response_cache)
+
+    return ExecutionResult(data=data, errors=None)
+
+
+def _request_from_document(schema, ast, root, context, variables, operation_name, mutation):
+    operation = get_operation(ast, operation_name)
+    variable_values = get_variable_values(schema, operation.variable_definitions or [], variables)
+
+    # The Python implementation of GraphQL currently lacks support
+    # for nulls, so we use the uncoerced variables when handling the
+    # request.
+    #
+    # See: https://github.com/graphql-python/graphql-core/issues/118
+    request = request_from_graphql_document(
+        ast,
+        root,
+        mutation_root=mutation,
+        context=context,
+        variables=variables,
+        operation_name=operation_name,
+    )
+    return request, variable_values
+
+
+def _type_names(request):
+    names = set()
+    requests = [request]
+
+    while requests:
+        request = requests.pop()
+        for selection in request.selections:
+            if selection.field.target is not None:
+                names.update(_value_type_names(selection.field.target))
+                requests.append(selection)
+
+    return names
+
+
+def _value_type_names(value):
+    if isinstance(value, JoinType):
+        return [value._cache_tag]
+    elif isinstance(value, ScalarJoinType):
+        names = _value_type_names(value._target)
+        if value._field.target is not None:
+            names = names + _value_type_names(value._field.target)
+        return names
+    else:
+        return []
+
+
+def _invalidate(request, context, response_cache):
+    for selection in request.selections:
+        invalidations = getattr(selection.field.target, "invalidations", None)
+        if invalidations is not None:
+            for invalidation in invalidations(selection.args, context):
+                invalidation.target.invalidate_entities(invalidation.keys)
+                if response_cache is not None:
+                    response_cache.delete_tagged(invalidation.target._cache_tag)
+
+
 class Result(object):
     def __init__(self, value, join_values):
         self.value = value
@@ -117,6 +399,7 @@ class FieldBase(object):
 class Field(FieldBase):
     target = None
     args = {}
+    cost = 1
 
     def __init__(self, type, **kwargs):
         self.type = type
@@ -148,7 +431,7 @@ def relationship(join=None, args=None, internal=False, **kwargs):
 
 
 class Relationship(FieldBase):
-    def __init__(self, target, process_results, wrap_type, build_query, join, args, internal):
+    def __init__(self, target, process_results, wrap_type, build_query, join, args, internal, key_join=False, cost=1, is_list=False, pass_parent_join_values=False, child_list_size=None):
         self.target = target
         self.build_query = build_query
         self.join = join
@@ -156,6 +439,19 @@ class Relationship(FieldBase):
         self._process_results = process_results
         self._wrap_type = wrap_type
         self.internal = internal
+        self.cost = cost
+        self.is_list = is_list
+        # When set, called with the args of the relationship to find the size
+        # of lists selected directly beneath it, such as the edges of a
+        # connection whose first argument is on the connection itself.
+        self.child_list_size = child_list_size
+        # A key join selects exactly those values of the target whose join
+        # fields match the join values of the parent, so fetches of the
+        # relationship can be batched using select_by_keys on the target.
+        self.key_join = key_join
+        # When set, build_query is also passed the distinct join values of
+        # the already-fetched parents, so that it need not query them again.
+        self.pass_parent_join_values = pass_parent_join_values
 
         self._parent_join_keys = tuple("_graphjoiner_joinToChildrenKey_" + parent_key for parent_key in self.join.keys())
 
@@ -179,6 +475,11 @@ class Relationship(FieldBase):
             wrap_type=self._wrap_type,
             process_results=self._process_results,
             internal=internal,
+            key_join=self.key_join,
+            cost=self.cost,
+            is_list=self.is_list,
+            pass_parent_join_values=self.pass_parent_join_values,
+            child_list_size=self.child_list_size,
         )
 
     def parent_join_selections(self, parent):
@@ -188,22 +489,36 @@ class Relationship(FieldBase):
             for field_name, key in zip(self.join.keys(), self._parent_join_keys)
         ]
 
-    def fetch(self, request, parent_query):
-        query = self.build_query(request.args, parent_query, request.context)
-        join_fields = self.target.join_fields()
-        join_selections = [
-            _request_field(key="_graphjoiner_joinToParentKey_" + child_key, field=join_fields[child_key])
-            for child_key in self.join.values()
-        ]
+    def fetch(self, request, parent_query, row_counter=None):
+        fetcher = _Fetcher(row_counter)
+        results = self._fetch(request, parent_query, fetcher)
+        fetcher.run()
+        return results
 
-        child_request = request.copy(join_selections=join_selections)
-        results = self.target.fetch(child_request, query)
+    def _fetch(self, request, parent_query, fetcher, parent_join_values=None):
+        if self.pass_parent_join_values:
+            query = self.build_query(request.args, parent_query, request.context, parent_join_values=parent_join_values)
+        else:
+            query = self.build_query(request.args, parent_query, request.context)
+        child_request = self._child_request(request, self.join.values())
         return RelationshipResults(
-            results=results,
+            values=_fetch_grouped_values(self.target, child_request, query, fetcher),
             process_results=self._process_results,
             parent_join_keys=self._parent_join_keys,
         )
 
+    def _child_request(self, request, child_keys):
+        join_fields = self.target.join_fields()
+        join_selections = [
+            _request_field(key="_graphjoiner_joinToParentKey_" + child_key, field=join_fields[child_key])
+            for child_key in child_keys
+        ]
+        return request.copy(join_selections=join_selections)
+
+    def _parent_join_keys_for(self, child_keys):
+        parent_keys = dict((child_key, parent_key) for parent_key, child_key in six.iteritems(self.join))
+        return tuple("_graphjoiner_joinToChildrenKey_" + parent_keys[child_key] for child_key in child_keys)
+
     def to_graphql_field(self):
         # TODO: differentiate between root and non-root types properly
         if self.join:
@@ -228,20 +543,23 @@ class Relationship(FieldBase):
 
 
 class RelationshipResults(object):
-    def __init__(self, results, process_results, parent_join_keys):
-        key_func = lambda result: result.join_values
-        self._results = dict(
-            (key, [result.value for result in results])
-            for key, results in groupby(sorted(results, key=key_func), key=key_func)
-        )
+    def __init__(self, values, process_results, parent_join_keys):
+        # values maps join values to the list of values with those join values
+        self._results = values
         self._process_results = process_results
         self._parent_join_keys = parent_join_keys
 
     def _parent_join_values(self, parent):
         return tuple(parent[join_field] for join_field in self._parent_join_keys)
 
-    def get(self, key):
-        return self._process_results(self._results.get(self._parent_join_values(key), []))
+    def get(self, key, projection=None):
+        values = self._results.get(self._parent_join_values(key), [])
+        if projection is not None:
+            values = [
+                dict((value_key, value[value_key]) for value_key in projection)
+                for value in values
+            ]
+        return self._process_results(values)
 
 
 def single(target, build_query, **kwargs):
@@ -303,6 +621,7 @@ def many(target, build_query, **kwargs):
         build_query=build_query,
         process_results=lambda x: x,
         wrap_type=lambda graphql_type: GraphQLNonNull(GraphQLList(graphql_type)),
+        is_list=True,
         **kwargs
     )
 
@@ -334,7 +653,7 @@ class ScalarJoinType(Value):
     def join_fields(self):
         return self._target.join_fields()
 
-    def fetch(self, request, query):
+    def fetch(self, request, query, row_counter=None):
         field_request = Request(
             key=self._field_name,
             field=self._field,
@@ -343,26 +662,50 @@ class ScalarJoinType(Value):
             join_selections=(),
             args={},
         )
-        results = self._target.fetch(request.copy(selections=[field_request]), query)
+        results = self._target.fetch(request.copy(selections=[field_request]), query, row_counter=row_counter)
         return [
             Result(value=result.value[self._field_name], join_values=result.join_values)
             for result in results
         ]
 
+    def _extracts_immediate_field(self):
+        return isinstance(self._target, JoinType) and not isinstance(self._field, Relationship)
+
+    def _fetch_grouped_immediates(self, request, query, fetcher):
+        # The extracted field is fetched alongside the join fields, and each
+        # row grouped by its join values, without building intermediate
+        # results.
+        selections = [_request_field(field=self._field, key=self._field_name)] + list(request.join_selections)
+        rows = self._target._fetch_immediate_rows(selections, query, request.context)
+        values = {}
+        for row in fetcher.count_rows(rows):
+            values.setdefault(tuple(row[1:]), []).append(row[0])
+        return values
+
     def to_graphql_type(self):
         return self._field.to_graphql_field().type
 
 
 class JoinType(Value):
-    def __init__(self, name, fetch_immediates, fields, interfaces=None):
+    def __init__(self, name, fetch_immediates, fields, interfaces=None, select_by_keys=None, entity_cache=None, invalidates=None, fetch_immediates_by_keys=None, cache_tag=None):
         if interfaces is None:
             interfaces = ()
+        if cache_tag is None:
+            cache_tag = name
+        if entity_cache is not None and select_by_keys is None:
+            raise ValueError("select_by_keys must be set to use an entity cache")
 
         self._name = name
         self._fetch_immediates = fetch_immediates
+        self._fetch_immediates_by_keys = fetch_immediates_by_keys
         self._generate_fields = fields
         self._interfaces = interfaces
+        self._select_by_keys = select_by_keys
+        self._entity_cache = entity_cache
+        self._invalidates = invalidates
+        self._cache_tag = cache_tag
         self._fields = None
+        self._field_names = None
         self._graphql_type = None
 
     def fields(self):
@@ -370,10 +713,47 @@ class JoinType(Value):
             self._fields = self._generate_fields()
         return self._fields
 
+    def invalidate_entities(self, keys=None):
+        if self._entity_cache is None:
+            pass
+        elif keys is None:
+            self._entity_cache.cache.delete_tagged(self._name)
+        else:
+            for key in keys:
+                self._entity_cache.cache.delete((self._name, tuple(key)))
+
+    def invalidations(self, args, context):
+        if self._invalidates is None:
+            return ()
+        else:
+            return self._invalidates(args, context)
+
     def join_fields(self):
         return self.fields()
 
-    def fetch(self, request, query):
+    def fetch(self, request, query, row_counter=None, pool=None):
+        fetcher = _Fetcher(row_counter, pool=pool)
+        results = self._fetch(request, query, fetcher)
+        fetcher.run()
+        return results
+
+    def _fetch(self, request, query, fetcher):
+        immediate_selections, relationship_selections = self._immediate_selections(request)
+        rows = self._fetch_immediate_rows(immediate_selections, query, request.context)
+        return self._build_results(request, immediate_selections, relationship_selections, rows, query, fetcher)
+
+    def _fetch_by_keys(self, request, fields, keys, fetcher):
+        # The rows for each key are looked up by the type itself, so there's
+        # no query to pass on to relationships of the fetched values.
+        immediate_selections, relationship_selections = self._immediate_selections(request)
+        rows = (
+            row
+            for key_rows in self._fetch_immediates_by_keys(immediate_selections, fields, keys, request.context)
+            for row in key_rows
+        )
+        return self._build_results(request, immediate_selections, relationship_selections, rows, None, fetcher)
+
+    def _immediate_selections(self, request):
         (relationship_selections, requested_immediate_selections) = partition(
             lambda selection: isinstance(selection.field, Relationship),
             request.selections,
@@ -390,27 +770,109 @@ class JoinType(Value):
             key=lambda selection: selection.key,
         )
 
+        return immediate_selections, relationship_selections
+
+    def _build_results(self, request, immediate_selections, relationship_selections, rows, query, fetcher):
+        if request.field is not None:
+            rows = fetcher.count_rows(rows)
+        rows = list(rows)
+
+        # Values are read from the rows a column at a time, since building
+        # results is where most of the time goes for large fetches.
+        positions = dict((selection.key, index) for index, selection in enumerate(immediate_selections))
+        value_keys = [selection.key for selection in request.selections if selection.key in positions]
+        row_values = _read_columns(rows, [positions[key] for key in value_keys])
+
+        if relationship_selections:
+            # Relationships are filled in by the fetcher once they've been
+            # fetched, so only the keys to join to children are kept.
+            template = dict((selection.key, None) for selection in request.selections)
+            values = []
+            for row_value in row_values:
+                value = template.copy()
+                value.update(zip(value_keys, row_value))
+                values.append(value)
+
+            join_to_children_keys = unique(
+                [
+                    key
+                    for selection in relationship_selections
+                    for key in selection.field._parent_join_keys
+                ],
+                key=lambda key: key,
+            )
+            parents = [
+                dict(zip(join_to_children_keys, join_values))
+                for join_values in _read_columns(rows, [positions[key] for key in join_to_children_keys])
+            ]
+            for group in _group_relationship_selections(relationship_selections):
+                fetcher.add(_RelationshipFetch(group, query, parents, values))
+        else:
+            values = [dict(zip(value_keys, row_value)) for row_value in row_values]
 
-        keys = tuple(selection.key for selection in immediate_selections)
-
-        results = [
-            dict(zip(keys, row))
-            for row in self._fetch_immediates(immediate_selections, query, request.context)
+        join_values = _read_columns(rows, [positions[selection.key] for selection in request.join_selections])
+        return [
+            Result(value, value_join_values)
+            for value, value_join_values in zip(values, join_values)
         ]
 
-        for selection in relationship_selections:
-            children = selection.field.fetch(selection, query)
-            for result in results:
-                result[selection.key] = children.get(result)
+    def _fetch_immediate_rows(self, selections, query, context):
+        if self._entity_cache is None or any(selection.args for selection in selections):
+            return self._fetch_immediates(selections, query, context)
+        else:
+            return self._fetch_cached_immediate_rows(selections, query, context)
+
+    def _fetch_cached_immediate_rows(self, selections, query, context):
+        # Only the keys of the entities are fetched using the original query.
+        # The values of any entities that aren't already cached are then
+        # fetched by selecting those entities by key.
+        fields = self.fields()
+        cache = self._entity_cache.cache
+        key_names = self._entity_cache.key
+        names = [self._field_name(selection.field) for selection in selections]
+
+        key_selections = [_request_field(field=fields[name], key=name) for name in key_names]
+        keys = [tuple(row) for row in self._fetch_immediates(key_selections, query, context)]
+
+        entities = {}
+        missing_entities = collections.OrderedDict()
+        for key in unique(keys, key=lambda key: key):
+            entity = cache.get((self._name, key))
+            if entity is not None and all(name in entity for name in names):
+                entities[key] = entity
+            else:
+                missing_entities[key] = entity or {}
+
+        if missing_entities:
+            missing_names = unique(list(key_names) + names, key=lambda name: name)
+            missing_selections = [_request_field(field=fields[name], key=name) for name in missing_names]
+            missing_query = self._select_by_keys(
+                [fields[name] for name in key_names],
+                list(missing_entities.keys()),
+                context,
+            )
+            for row in self._fetch_immediates(missing_selections, missing_query, context):
+                values = dict(zip(missing_names, row))
+                key = tuple(values[name] for name in key_names)
+                entity = dict(missing_entities.get(key, {}))
+                entity.update(values)
+                cache.set((self._name, key), entity, tags=(self._name, ))
+                entities[key] = entity
 
         return [
-            Result(
-                dict((selection.key, result[selection.key]) for selection in request.selections),
-                tuple(result[selection.key] for selection in request.join_selections),
-            )
-            for result in results
+            tuple(entities[key][name] for name in names)
+            for key in keys
+            if key in entities
         ]
 
+    def _field_name(self, field):
+        if self._field_names is None:
+            self._field_names = dict(
+                (field, name)
+                for name, field in six.iteritems(self.fields())
+            )
+        return self._field_names[field]
+
     def to_graphql_type(self):
         if self._graphql_type is None:
             self._graphql_type = GraphQLObjectType(
@@ -426,6 +888,296 @@ class JoinType(Value):
         return GraphQLNonNull(self._graphql_type)
 
 
+def _group_relationship_selections(selections):
+    # Selections of the same relationship with the same arguments, such as
+    # aliases of the same field, are fetched once using the union of their
+    # sub-selections.
+    groups = []
+    for selection in selections:
+        group = find(lambda group: group.add(selection), groups)
+        if group is None:
+            groups.append(_RelationshipSelectionGroup(selection))
+    return groups
+
+
+class _RelationshipSelectionGroup(object):
+    def __init__(self, selection):
+        self.selections = [selection]
+        self._children = collections.OrderedDict(
+            (child.key, child)
+            for child in selection.selections
+        )
+
+    def add(self, selection):
+        first = self.selections[0]
+        if selection.field is not first.field or selection.args != first.args:
+            return False
+
+        if not all(
+            child.key not in self._children or _requests_equal(child, self._children[child.key])
+            for child in selection.selections
+        ):
+            return False
+
+        # Only results of join types can be projected onto the
+        # sub-selections of each selection.
+        if not isinstance(selection.field.target, JoinType) and not (
+            len(selection.selections) == len(self._children) and
+            all(child.key in self._children for child in selection.selections)
+        ):
+            return False
+
+        self.selections.append(selection)
+        for child in selection.selections:
+            self._children.setdefault(child.key, child)
+        return True
+
+    def request(self):
+        return self.selections[0].copy(selections=list(self._children.values()))
+
+
+def _fetch_grouped_values(target, request, query, fetcher):
+    if isinstance(target, ScalarJoinType) and target._extracts_immediate_field():
+        return target._fetch_grouped_immediates(request, query, fetcher)
+    else:
+        return _group_results(_fetch_value(target, request, query, fetcher))
+
+
+def _group_results(results):
+    values = {}
+    for result in results:
+        values.setdefault(result.join_values, []).append(result.value)
+    return values
+
+
+def _fetch_value(target, request, query, fetcher):
+    if isinstance(target, JoinType):
+        return target._fetch(request, query, fetcher)
+    elif isinstance(target, ScalarJoinType):
+        return target.fetch(request, query, row_counter=fetcher.row_counter)
+    else:
+        return target.fetch(request, query)
+
+
+class _Fetcher(object):
+    # Relationships are fetched breadth-first so that fetches at the same
+    # depth can be batched together. Values are projected once all
+    # fetches are complete, deepest first, since projection copies values.
+    # Given a pool, the batches of fetches at each depth are run
+    # concurrently.
+    def __init__(self, row_counter, pool=None):
+        self.row_counter = row_counter
+        self._pool = pool
+        self._pending = []
+        self._deferred = []
+
+    def count_rows(self, rows):
+        if self.row_counter is None:
+            return rows
+        else:
+            return self.row_counter.count(rows)
+
+    def add(self, relationship_fetch):
+        self._pending.append(relationship_fetch)
+
+    def defer(self, func):
+        self._deferred.append(func)
+
+    def run(self):
+        while self._pending:
+            pending, self._pending = self._pending, []
+            batches = _batch_relationship_fetches(pending)
+            if self._pool is None or len(batches) == 1:
+                for batch in batches:
+                    batch.fetch(self)
+            else:
+                self._fetch_concurrently(batches)
+
+        deferred, self._deferred = self._deferred, []
+        for func in reversed(deferred):
+            func()
+
+    def _fetch_concurrently(self, batches):
+        # Each batch is fetched using its own fetcher, so that fetches added
+        # by concurrent batches are then collected in the same order as if
+        # the batches had been fetched one after another.
+        fetchers = [_Fetcher(self.row_counter) for batch in batches]
+        self._pool.map(lambda args: args[0].fetch(args[1]), list(zip(batches, fetchers)))
+        for fetcher in fetchers:
+            self._pending += fetcher._pending
+            self._deferred += fetcher._deferred
+
+
+class _FetchPool(object):
+    def __init__(self, concurrency):
+        self._concurrency = concurrency
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def map(self, func, values):
+        return self._thread_pool().map(func, values)
+
+    def _thread_pool(self):
+        # Threads don't survive forking, so each process creates its own
+        # pool the first time that it's used.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = ThreadPool(self._concurrency)
+                self._pid = os.getpid()
+            return self._pool
+
+
+class _RelationshipFetch(object):
+    def __init__(self, group, parent_query, rows, values):
+        self.request = group.request()
+        self._selections = group.selections
+        self._parent_query = parent_query
+        self._rows = rows
+        self._values = values
+
+    def fetch(self, fetcher):
+        field = self.request.field
+        if field.pass_parent_join_values:
+            parent_join_values = [
+                dict(zip(field.join.keys(), key))
+                for key in unique(self.parent_keys(field._parent_join_keys), key=lambda key: key)
+                if None not in key
+            ]
+        else:
+            parent_join_values = None
+        children = field._fetch(self.request, self._parent_query, fetcher, parent_join_values=parent_join_values)
+        self.set_children(children, fetcher)
+
+    def parent_keys(self, parent_join_keys):
+        return [
+            tuple(row[parent_join_key] for parent_join_key in parent_join_keys)
+            for row in self._rows
+        ]
+
+    def set_children(self, children, fetcher):
+        group_keys = [child.key for child in self.request.selections]
+        for selection in self._selections:
+            projection = [child.key for child in selection.selections]
+            if projection == group_keys:
+                self._set_selection(selection, children, None)
+            else:
+                fetcher.defer(partial(self._set_selection, selection, children, projection))
+
+    def _set_selection(self, selection, children, projection):
+        for row, value in zip(self._rows, self._values):
+            value[selection.key] = children.get(row, projection=projection)
+
+
+def _batch_relationship_fetches(relationship_fetches):
+    # Fetches of key joins to the same type with the same selections, such
+    # as fetches of authors from both books and reviews, are combined into a
+    # single fetch using the union of the join values of their parents.
+    batches = []
+    for relationship_fetch in relationship_fetches:
+        batch = find(lambda batch: batch.add(relationship_fetch), batches)
+        if batch is None:
+            batches.append(_RelationshipFetchBatch(relationship_fetch))
+    return batches
+
+
+class _RelationshipFetchBatch(object):
+    def __init__(self, relationship_fetch):
+        self._fetches = [relationship_fetch]
+
+    def add(self, relationship_fetch):
+        first = self._fetches[0]
+        if (
+            _is_batchable(first) and
+            _is_batchable(relationship_fetch) and
+            relationship_fetch.request.field.target is first.request.field.target and
+            _child_join_keys(relationship_fetch) == _child_join_keys(first) and
+            _selections_equal(relationship_fetch.request.selections, first.request.selections)
+        ):
+            self._fetches.append(relationship_fetch)
+            return True
+        else:
+            return False
+
+    def fetch(self, fetcher):
+        first = self._fetches[0]
+        target = first.request.field.target
+
+        if len(self._fetches) == 1 and (not _is_batchable(first) or target._fetch_immediates_by_keys is None):
+            first.fetch(fetcher)
+            return
+
+        child_keys = _child_join_keys(first)
+        parent_keys = [
+            relationship_fetch.request.field._parent_join_keys_for(child_keys)
+            for relationship_fetch in self._fetches
+        ]
+
+        keys = unique(
+            [
+                key
+                for relationship_fetch, parent_join_keys in zip(self._fetches, parent_keys)
+                for key in relationship_fetch.parent_keys(parent_join_keys)
+                if None not in key
+            ],
+            key=lambda key: key,
+        )
+
+        if keys:
+            join_fields = target.join_fields()
+            fields = [join_fields[child_key] for child_key in child_keys]
+            child_request = first.request.field._child_request(first.request, child_keys)
+            if target._fetch_immediates_by_keys is None:
+                query = target._select_by_keys(fields, keys, first.request.context)
+                results = target._fetch(child_request, query, fetcher)
+            else:
+                results = target._fetch_by_keys(child_request, fields, keys, fetcher)
+        else:
+            results = []
+
+        values = _group_results(results)
+        for relationship_fetch, parent_join_keys in zip(self._fetches, parent_keys):
+            children = RelationshipResults(
+                values=values,
+                process_results=relationship_fetch.request.field._process_results,
+                parent_join_keys=parent_join_keys,
+            )
+            relationship_fetch.set_children(children, fetcher)
+
+
+def _is_batchable(relationship_fetch):
+    relationship = relationship_fetch.request.field
+    return (
+        relationship.key_join and
+        relationship.join and
+        not relationship_fetch.request.args and
+        isinstance(relationship.target, JoinType) and (
+            relationship.target._select_by_keys is not None or
+            relationship.target._fetch_immediates_by_keys is not None
+        )
+    )
+
+
+def _child_join_keys(relationship_fetch):
+    return sorted(relationship_fetch.request.field.join.values())
+
+
+def _selections_equal(left, right):
+    return len(left) == len(right) and all(
+        _requests_equal(left_child, right_child)
+        for left_child, right_child in zip(left, right)
+    )
+
+
+def _requests_equal(left, right):
+    return (
+        left.key == right.key and
+        left.field is right.field and
+        left.args == right.args and
+        _selections_equal(left.selections, right.selections)
+    )
+
+
 def RootJoinType(**kwargs):
     return JoinType(fetch_immediates=lambda *_: [()], **kwargs)
 
@@ -437,6 +1189,13 @@ def _nullable(graphql_type):
         return graphql_type
 
 
+def _read_columns(rows, positions):
+    if positions:
+        return list(zip(*[list(map(itemgetter(position), rows)) for position in positions]))
+    else:
+        return [()] * len(rows)
+
+
 def _request_field(field, key):
     return Request(
         field=field,
@@ -0,0 +1,113 @@
+import abc
+import collections
+import threading
+import time
+
+import six
+
+
+class Cache(six.with_metaclass(abc.ABCMeta, object)):
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the value for key, or None if there is no such value"""
+
+    @abc.abstractmethod
+    def set(self, key, value, tags=()):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key):
+        pass
+
+    @abc.abstractmethod
+    def delete_tagged(self, tag):
+        """Delete all values that were set with tag in their tags"""
+
+
+class InMemoryCache(Cache):
+    """Cache values in process memory
+
+    Once max_size values are stored, setting a new value evicts the least
+    recently used value. If ttl is set, values expire ttl seconds after
+    being set."""
+
+    def __init__(self, max_size, ttl=None, clock=time.time):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._keys_by_tag = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value, tags = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                return None
+
+            del self._entries[key]
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, tags=()):
+        if self._ttl is None:
+            expires_at = None
+        else:
+            expires_at = self._clock() + self._ttl
+
+        tags = tuple(tags)
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires_at, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self._max_size:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def delete_tagged(self, tag):
+        with self._lock:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            _, _, tags = entry
+            for tag in tags:
+                keys = self._keys_by_tag[tag]
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+class EntityCache(object):
+    """Cache the values of the immediate fields of entities by key
+
+    key is the sequence of names of fields that uniquely identify each
+    entity."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = tuple(key)
+
+
+class Invalidation(object):
+    """Describe the cached values of target that are changed by a mutation
+
+    If keys is None, all cached values of target are invalidated. Otherwise,
+    only the entities with the given keys are invalidated."""
+
+    def __init__(self, target, keys=None):
+        self.target = target
+        self.keys = keys
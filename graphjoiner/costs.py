@@ -0,0 +1,105 @@
+import threading
+
+from graphql import GraphQLError
+
+
+_list_size_arg_names = ("first", "limit")
+
+
+class QueryLimits(object):
+    def __init__(self, max_cost=None, max_depth=None, default_list_size=10, max_rows=None, max_rows_per_fetch=None):
+        self.max_cost = max_cost
+        self.max_depth = max_depth
+        self.default_list_size = default_list_size
+        self.max_rows = max_rows
+        self.max_rows_per_fetch = max_rows_per_fetch
+
+    def row_counter(self):
+        if self.max_rows is None and self.max_rows_per_fetch is None:
+            return None
+        else:
+            return RowCounter(max_rows=self.max_rows, max_rows_per_fetch=self.max_rows_per_fetch)
+
+    def check(self, request):
+        if self.max_depth is not None:
+            depth = request_depth(request)
+            if depth > self.max_depth:
+                raise GraphQLError("Query has depth of {} which exceeds maximum depth of {}".format(depth, self.max_depth))
+
+        if self.max_cost is not None:
+            cost = request_cost(request, default_list_size=self.default_list_size)
+            if cost > self.max_cost:
+                raise GraphQLError("Query has cost of {} which exceeds maximum cost of {}".format(cost, self.max_cost))
+
+
+def request_depth(request):
+    return max([1 + request_depth(selection) for selection in request.selections] or [0])
+
+
+def request_cost(request, default_list_size, list_size=None):
+    """Estimate the cost of the selections of request
+
+    Each selected field costs its cost attribute. The cost of the
+    selections of a list relationship is multiplied by its first or limit
+    argument, or by default_list_size if neither argument is set. Lists
+    beneath a relationship with child_list_size, such as the edges of a
+    connection, instead default to the size it gives for its args."""
+    if list_size is None:
+        list_size = default_list_size
+
+    return sum(
+        getattr(selection.field, "cost", 1) +
+        _list_size(selection, list_size) * request_cost(
+            selection,
+            default_list_size,
+            list_size=_child_list_size(selection, default_list_size),
+        )
+        for selection in request.selections
+    )
+
+
+def _list_size(selection, default_list_size):
+    if not getattr(selection.field, "is_list", False):
+        return 1
+
+    for arg_name in _list_size_arg_names:
+        if selection.args.get(arg_name) is not None:
+            # Negative sizes would otherwise reduce the cost of other fields
+            return max(0, selection.args[arg_name])
+
+    return default_list_size
+
+
+def _child_list_size(selection, default_list_size):
+    child_list_size = getattr(selection.field, "child_list_size", None)
+    if child_list_size is None:
+        return default_list_size
+    else:
+        return max(0, child_list_size(selection.args))
+
+
+class RowCounter(object):
+    """Count the rows fetched for a single request
+
+    Rows are counted as they're iterated over, so fetching stops as soon as
+    a limit is exceeded."""
+
+    def __init__(self, max_rows, max_rows_per_fetch):
+        self._max_rows = max_rows
+        self._max_rows_per_fetch = max_rows_per_fetch
+        self._rows = 0
+        # Fetches may run concurrently
+        self._lock = threading.Lock()
+
+    def count(self, rows):
+        fetch_rows = 0
+        for row in rows:
+            fetch_rows += 1
+            with self._lock:
+                self._rows += 1
+                total_rows = self._rows
+            if self._max_rows_per_fetch is not None and fetch_rows > self._max_rows_per_fetch:
+                raise GraphQLError("Fetch exceeded maximum of {} rows".format(self._max_rows_per_fetch))
+            if self._max_rows is not None and total_rows > self._max_rows:
+                raise GraphQLError("Request exceeded maximum of {} rows".format(self._max_rows))
+            yield row
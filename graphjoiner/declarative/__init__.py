@@ -9,17 +9,18 @@ from graphql import GraphQLArgument, GraphQLInputObjectType, GraphQLInterfaceTyp
 import six
 
 import graphjoiner
+from ..caches import EntityCache, Invalidation
 from .lazy import lazy, lazy_property
 
 
-def executor(root, mutation=None):
+def executor(root, mutation=None, **kwargs):
     root_type = root.__graphjoiner__
     if mutation is None:
         mutation_type = None
     else:
         mutation_type = mutation.__graphjoiner__
 
-    return graphjoiner.executor(root_type, mutation=mutation_type)
+    return graphjoiner.executor(root_type, mutation=mutation_type, **kwargs)
 
 
 class Type(object):
@@ -51,13 +52,17 @@ class ObjectTypeMeta(TypeMeta):
         if attrs.get("__abstract__"):
             return cls
 
-        _, fields = _declare_fields(cls)
+        field_definitions, fields = _declare_fields(cls)
 
         cls.__graphjoiner__ = graphjoiner.JoinType(
             name=cls.__name__,
             fields=fields,
             fetch_immediates=getattr(cls, "__fetch_immediates__", None),
             interfaces=lambda: _declare_interfaces(attrs),
+            select_by_keys=getattr(cls, "__select_by_keys__", None),
+            entity_cache=_declare_entity_cache(cls, field_definitions),
+            invalidates=getattr(cls, "__invalidates__", None),
+            fetch_immediates_by_keys=getattr(cls, "__fetch_immediates_by_keys__", None),
         )
         cls.__graphql__ = cls.__graphjoiner__.to_graphql_type()
 
@@ -105,6 +110,21 @@ def _declare_fields(cls):
     ], fields
 
 
+def _declare_entity_cache(cls, field_definitions):
+    cache = getattr(cls, "__entity_cache__", None)
+    if cache is None:
+        return None
+    else:
+        field_names = dict(
+            (field_definition.attr_name, field_definition.field_name)
+            for field_definition in field_definitions
+        )
+        return EntityCache(
+            cache=cache,
+            key=[field_names[attr_name] for attr_name in cls.__entity_key__],
+        )
+
+
 def _declare_interfaces(attrs):
     interfaces = attrs.get("__interfaces__", [])
     if not isinstance(interfaces, collections.Iterable):
@@ -205,9 +225,9 @@ class FieldSet(object):
         self._fields = fields
 
 
-def relationship(select_values, relationship_type, args=None, internal=False):
+def relationship(select_values, relationship_type, args=None, internal=False, cost=1):
     return LazyFieldDefinition(
-        lambda: select_values()(partial(relationship_type, internal=internal)),
+        lambda: select_values()(partial(relationship_type, internal=internal, cost=cost)),
         args=args,
     )
 
@@ -225,15 +245,23 @@ class RelationshipDefinition(FieldDefinition):
         self._args = []
 
     def instantiate(self):
-        self._target, build_query, join = self._build_join(self._owner)
-
-        def build_query_with_args(args, parent_query, context):
-            query = build_query(parent_query, context=context)
+        built_join = self._build_join(self._owner)
+        self._target, build_query, join = built_join[:3]
+        join_options = built_join[3] if len(built_join) > 3 else {}
+        key_join = join_options.get("key_join", False) and self._filter is None
+        pass_parent_join_values = join_options.get("parent_join_values", False)
+        child_list_size = join_options.get("child_list_size")
+        # Arguments added by the join are applied after any other arguments,
+        # since they may depend on the final query, such as for pagination.
+        all_args = self._args + list(join_options.get("args", ()))
+
+        def build_query_with_args(args, parent_query, context, **kwargs):
+            query = build_query(parent_query, context=context, **kwargs)
 
             if self._filter is not None:
                 query = self._filter(query)
 
-            for arg_name, _, refine_query in self._args:
+            for arg_name, _, refine_query in all_args:
                 if arg_name in args:
                     query = refine_query(query, args[arg_name], context=context)
 
@@ -241,10 +269,15 @@ class RelationshipDefinition(FieldDefinition):
 
         args = dict(
             (arg_name, GraphQLArgument(arg_type))
-            for arg_name, arg_type, _ in self._args
+            for arg_name, arg_type, _ in all_args
         )
 
-        return self._func(self._target.__graphjoiner__, build_query_with_args, join=join, args=args)
+        return self._func(
+            self._target.__graphjoiner__, build_query_with_args,
+            join=join, args=args, key_join=key_join,
+            pass_parent_join_values=pass_parent_join_values,
+            child_list_size=child_list_size,
+        )
 
     def arg(self, arg_name, arg_type):
         def add_arg(refine_query):
@@ -355,11 +388,17 @@ def select(local, target, join_query=None, join_fields=None):
         else:
             return join_query(parent_query, target_query)
 
-    return join.build(local, target, query=build_query, join_fields=join_fields)
+    return join.build(
+        local,
+        target,
+        query=build_query,
+        join_fields=join_fields,
+        key_join=join_query is None,
+    )
 
 
 @join_builder
-def join(local, target, query, join_fields):
+def join(local, target, query, join_fields, key_join=False):
     build_query = _optional_argument("context", query, positional_args=1)
 
     if join_fields is None:
@@ -370,7 +409,7 @@ def join(local, target, query, join_fields):
             for local_field, remote_field in six.iteritems(join_fields)
         )
 
-    return target, build_query, join_fields
+    return target, build_query, join_fields, {"key_join": key_join and bool(join_fields)}
 
 
 class InterfaceTypeMeta(TypeMeta):
@@ -492,14 +531,23 @@ class DictQuery(object):
 
 class Mutation(DictQuery):
     @classmethod
-    def __fetch_immediates__(cls, *args, **kwargs):
-        return cls.__mutate__(*args, **kwargs)
+    def __fetch_immediates__(cls, selections, query, context):
+        # Sessions that route reads and writes, such as those from a
+        # ReplicaRouter, are switched to writing before anything is mutated.
+        use_primary = getattr(getattr(context, "session", None), "use_primary", None)
+        if use_primary is not None:
+            use_primary()
+        return cls.__mutate__(selections, query, context)
 
 
 def mutation_field(target):
     return single(lambda: select(target()), args=target().__args__)
 
 
+def invalidate(type_, keys=None):
+    return Invalidation(type_.__graphjoiner__, keys=keys)
+
+
 class _Undefined(object):
     def __bool__(self):
         return False
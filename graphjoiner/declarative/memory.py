@@ -0,0 +1,67 @@
+from __future__ import absolute_import
+
+import weakref
+
+from . import ObjectType
+
+
+class InMemoryObjectType(ObjectType):
+    __abstract__ = True
+
+    @classmethod
+    def __select_all__(cls):
+        return cls.__records__
+
+    @classmethod
+    def __select_by_keys__(cls, fields, keys, context):
+        index = _index(cls, tuple(field.attr_name for field in fields))
+        return [
+            record
+            for key in keys
+            for record in index.get(key, ())
+        ]
+
+    @classmethod
+    def __fetch_immediates__(cls, selections, records, context):
+        read = _reader([selection.field.attr_name for selection in selections])
+        return [read(record) for record in records]
+
+    @classmethod
+    def __fetch_immediates_by_keys__(cls, selections, fields, keys, context):
+        index = _index(cls, tuple(field.attr_name for field in fields))
+        read = _reader([selection.field.attr_name for selection in selections])
+        return [
+            [read(record) for record in index.get(key, ())]
+            for key in keys
+        ]
+
+    @classmethod
+    def __reindex__(cls):
+        _indexes.pop(cls, None)
+
+
+_indexes = weakref.WeakKeyDictionary()
+
+
+def _index(cls, attr_names):
+    # Indexes are built the first time the records are looked up by the
+    # given attributes, and then reused until the type is reindexed.
+    indexes = _indexes.setdefault(cls, {})
+    index = indexes.get(attr_names)
+    if index is None:
+        read = _reader(attr_names)
+        index = {}
+        for record in cls.__records__:
+            index.setdefault(read(record), []).append(record)
+        indexes[attr_names] = index
+    return index
+
+
+def _reader(attr_names):
+    def read(record):
+        if isinstance(record, dict):
+            return tuple(record[attr_name] for attr_name in attr_names)
+        else:
+            return tuple(getattr(record, attr_name) for attr_name in attr_names)
+
+    return read
@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+
+import os
+import weakref
+
+import numpy
+
+from . import ObjectType
+
+
+class NumpyObjectType(ObjectType):
+    __abstract__ = True
+
+    @classmethod
+    def __select_all__(cls):
+        return numpy.arange(_length(cls.__columns__))
+
+    @classmethod
+    def __select_by_keys__(cls, fields, keys, context):
+        return numpy.concatenate([numpy.arange(0)] + _key_indices(cls, fields, keys))
+
+    @classmethod
+    def __fetch_immediates__(cls, selections, indices, context):
+        return _read_rows(cls.__columns__, selections, indices)
+
+    @classmethod
+    def __fetch_immediates_by_keys__(cls, selections, fields, keys, context):
+        key_indices = _key_indices(cls, fields, keys)
+        # Rows are read for all keys at once, and then split into the rows for
+        # each key, so that each column is only indexed once.
+        rows = _read_rows(
+            cls.__columns__,
+            selections,
+            numpy.concatenate([numpy.arange(0)] + key_indices),
+        )
+        ends = numpy.cumsum([len(indices) for indices in key_indices]).tolist()
+        return [
+            rows[start:end]
+            for start, end in zip([0] + ends, ends)
+        ]
+
+    @classmethod
+    def __reindex__(cls):
+        _indexes.pop(cls, None)
+
+
+def _length(columns):
+    return len(next(iter(columns.values())))
+
+
+def _read_rows(columns, selections, indices):
+    if not selections:
+        return [()] * len(indices)
+    else:
+        return list(zip(*(
+            columns[selection.field.attr_name][indices].tolist()
+            for selection in selections
+        )))
+
+
+_indexes = weakref.WeakKeyDictionary()
+
+
+def _index(cls, attr_name):
+    # Each index is the order that sorts the column, along with the sorted
+    # column, so that matching values can be found using a binary search.
+    indexes = _indexes.setdefault(cls, {})
+    index = indexes.get(attr_name)
+    if index is None:
+        index = getattr(cls, "__column_indexes__", {}).get(attr_name)
+    if index is None:
+        index = _build_index(cls.__columns__[attr_name])
+    indexes[attr_name] = index
+    return index
+
+
+def _build_index(column):
+    order = numpy.argsort(column, kind="mergesort")
+    return order, column[order]
+
+
+def save_columns(path, columns, indexes=()):
+    for name, column in columns.items():
+        numpy.save(os.path.join(path, name + ".npy"), column)
+
+    for name in indexes:
+        order, sorted_column = _build_index(columns[name])
+        numpy.save(os.path.join(path, name + ".order.npy"), order)
+        numpy.save(os.path.join(path, name + ".sorted.npy"), sorted_column)
+
+
+def load_columns(path):
+    return dict(
+        (name, _load(path, name + ".npy"))
+        for name in _saved_names(path, ".npy")
+    )
+
+
+def load_column_indexes(path):
+    return dict(
+        (name, (_load(path, name + ".order.npy"), _load(path, name + ".sorted.npy")))
+        for name in _saved_names(path, ".order.npy")
+    )
+
+
+def _saved_names(path, suffix):
+    return [
+        filename[:-len(suffix)]
+        for filename in sorted(os.listdir(path))
+        if filename.endswith(suffix) and "." not in filename[:-len(suffix)]
+    ]
+
+
+def _load(path, filename):
+    # Arrays are memory-mapped read-only, so processes loading the same
+    # files share their pages rather than each having their own copy.
+    return numpy.load(os.path.join(path, filename), mmap_mode="r")
+
+
+def _key_indices(cls, fields, keys):
+    # Values are looked up using the first field of the key, and then any
+    # other fields are compared directly.
+    order, sorted_column = _index(cls, fields[0].attr_name)
+    first_values = [key[0] for key in keys]
+    starts = numpy.searchsorted(sorted_column, first_values, side="left")
+    ends = numpy.searchsorted(sorted_column, first_values, side="right")
+
+    key_indices = []
+    for key, start, end in zip(keys, starts, ends):
+        indices = order[start:end]
+        for field, value in zip(fields[1:], key[1:]):
+            indices = indices[cls.__columns__[field.attr_name][indices] == value]
+        key_indices.append(indices)
+    return key_indices
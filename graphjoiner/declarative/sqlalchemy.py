@@ -1,18 +1,37 @@
 from __future__ import absolute_import
 
+import base64
+import collections
+import datetime
+import decimal
+import hashlib
+import json
+import random
+import re
+import threading
+import uuid
+import weakref
+
 import graphql
 import six
 import sqlalchemy
 from sqlalchemy.orm import Query
 
+import graphjoiner
 from graphjoiner import declarative
-from . import field, get_field_definitions, ObjectType, join_builder
+from . import field, get_field_definitions, many, ObjectType, join_builder, select, single
 
 
 class SqlAlchemyObjectType(ObjectType):
-    @staticmethod
-    def __get_session__(context):
-        return context.session
+    @classmethod
+    def __get_session__(cls, context):
+        session = context.session
+        if isinstance(session, RoutedSessions):
+            return session.session(cls)
+        elif isinstance(session, SessionProvider):
+            return session.session()
+        else:
+            return session
 
     @classmethod
     def __select_all__(cls):
@@ -29,6 +48,10 @@ class SqlAlchemyObjectType(ObjectType):
         else:
             return query.filter(cls.__model__.__mapper__.polymorphic_on == polymorphic_identity)
 
+    @classmethod
+    def __select_by_keys__(cls, fields, keys, context):
+        return cls.__select_all__().filter(_columns_in([field.column for field in fields], keys))
+
     @classmethod
     def __fetch_immediates__(cls, selections, query, context):
         query = query.with_entities(*(
@@ -36,70 +59,793 @@ class SqlAlchemyObjectType(ObjectType):
             for selection in selections
         ))
 
-        return query.with_session(cls.__get_session__(context)).all()
+        # Rows are returned as they're read from the database, so that
+        # fetching can stop as soon as a row limit is exceeded.
+        session = cls.__get_session__(context)
+        if getattr(cls, "__prepare_statements__", False):
+            return _fetch_prepared(query, session)
+        else:
+            return iter(query.with_session(session).yield_per(_yield_per_rows))
+
+
+_yield_per_rows = 1000
+
+
+def _fetch_prepared(query, session):
+    # Each statement is prepared once for each database connection, and
+    # then executed by name, so the database only parses and plans
+    # statements of the same shape once.
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        return iter(query.with_session(session).yield_per(_yield_per_rows))
+
+    statement = _PreparedStatement(query.statement, connection.dialect)
+    # Only the most recently used statements are kept prepared, since
+    # statements such as those filtering by different numbers of keys would
+    # otherwise accumulate on long-lived connections.
+    prepared_names = connection.connection.info.setdefault(
+        "graphjoiner_prepared_statements",
+        collections.OrderedDict(),
+    )
+    if statement.name in prepared_names:
+        del prepared_names[statement.name]
+    else:
+        cursor = connection.connection.cursor()
+        try:
+            if len(prepared_names) >= _max_prepared_statements:
+                evicted_name, _ = prepared_names.popitem(last=False)
+                cursor.execute("DEALLOCATE {}".format(evicted_name))
+            cursor.execute(statement.prepare_sql)
+        finally:
+            cursor.close()
+    prepared_names[statement.name] = True
+
+    return iter(connection.execute(statement.execute_clause()))
+
+
+_max_prepared_statements = 100
+
+
+_pyformat_param_pattern = re.compile(r"%\(([^)]+)\)s")
+
+
+class _PreparedStatement(object):
+    def __init__(self, statement, dialect):
+        # Expanding parameters, such as the values of IN lists, are rendered
+        # as individual parameters so that they can be bound by position.
+        compiled = statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+        param_names = []
+
+        def replace_param(match):
+            param_name = match.group(1)
+            if param_name not in param_names:
+                param_names.append(param_name)
+            return "${}".format(param_names.index(param_name) + 1)
+
+        sql = _pyformat_param_pattern.sub(replace_param, compiled.string).replace("%%", "%")
+        param_types = [compiled.binds[param_name].type for param_name in param_names]
+
+        self.name = "graphjoiner_" + hashlib.sha1(sql.encode("utf-8")).hexdigest()
+        # Parameters of unknown type are left for the database to infer
+        if param_types and not any(isinstance(param_type, sqlalchemy.types.NullType) for param_type in param_types):
+            prepare_params = " ({})".format(", ".join(
+                dialect.type_compiler.process(param_type)
+                for param_type in param_types
+            ))
+        else:
+            prepare_params = ""
+        self.prepare_sql = "PREPARE {}{} AS {}".format(self.name, prepare_params, sql)
+
+        params = compiled.construct_params()
+        self._params = [
+            sqlalchemy.bindparam("p{}".format(index), params[param_name], type_=param_type)
+            for index, (param_name, param_type) in enumerate(zip(param_names, param_types))
+        ]
+        self._columns = [
+            sqlalchemy.column("c{}".format(index), type_=column.type)
+            for index, column in enumerate(statement.inner_columns)
+        ]
+
+    def execute_clause(self):
+        if self._params:
+            arguments = "({})".format(", ".join(":" + param.key for param in self._params))
+        else:
+            arguments = ""
+        return sqlalchemy.text("EXECUTE {}{}".format(self.name, arguments)) \
+            .bindparams(*self._params) \
+            .columns(*self._columns)
+
+
+class SessionProvider(object):
+    """Provide a separate session to each thread fetching values for a request
+
+    Sessions are created using session_factory the first time a thread
+    fetches values. If isolation_level is set, each session's transaction
+    uses that isolation level. If read_only is set, each session's
+    transaction is read-only, which requires a database that supports SET
+    TRANSACTION READ ONLY, such as PostgreSQL. If share_snapshot is set,
+    every session reads from the snapshot of the first session's
+    transaction, which requires PostgreSQL and an isolation level of
+    REPEATABLE READ or SERIALIZABLE.
+
+    close() closes every session from the calling thread, rather than the
+    thread that created it, so connections must allow being closed from
+    other threads, which SQLite only does with check_same_thread=False."""
+
+    def __init__(self, session_factory, isolation_level=None, read_only=False, share_snapshot=False):
+        self._session_factory = session_factory
+        self._isolation_level = isolation_level
+        self._read_only = read_only
+        self._share_snapshot = share_snapshot
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._snapshot = None
+
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._create_session()
+        return session
+
+    def _create_session(self):
+        session = self._session_factory()
+        if self._isolation_level is not None:
+            session.connection(execution_options={"isolation_level": self._isolation_level})
+        if self._read_only:
+            session.execute(sqlalchemy.text("SET TRANSACTION READ ONLY"))
+
+        with self._lock:
+            if self._share_snapshot:
+                if self._snapshot is None:
+                    self._snapshot = session.execute(sqlalchemy.text("SELECT pg_export_snapshot()")).scalar()
+                else:
+                    session.execute(sqlalchemy.text("SET TRANSACTION SNAPSHOT :snapshot"), {"snapshot": self._snapshot})
+            self._sessions.append(session)
+
+        return session
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+            self._snapshot = None
+        self._local = threading.local()
+        for session in reversed(sessions):
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ReplicaRouter(object):
+    """Route reads to replicas, and writes to the primary
+
+    primary and each of replicas are session factories. Each request reads
+    from a single replica chosen using choose_replica. overrides maps
+    object types to the session factory to read those types from instead,
+    such as the primary for types that must never be stale."""
+
+    def __init__(self, primary, replicas, overrides=None, choose_replica=random.choice):
+        if overrides is None:
+            overrides = {}
+
+        self._primary = primary
+        self._replicas = replicas
+        self._overrides = overrides
+        self._choose_replica = choose_replica
+
+    def sessions(self):
+        if self._replicas:
+            replica = self._choose_replica(self._replicas)
+        else:
+            replica = self._primary
+
+        return RoutedSessions(primary=self._primary, replica=replica, overrides=self._overrides)
+
+
+class RoutedSessions(object):
+    """The sessions for a single request routed by a ReplicaRouter
+
+    Writes should use the session returned by primary(). Once it's been
+    used, or use_primary() has been called, all sessions for the request
+    use the primary so that reads see those writes. Mutations call
+    use_primary() before mutating."""
+
+    def __init__(self, primary, replica, overrides):
+        self._primary = primary
+        self._replica = replica
+        self._overrides = overrides
+        self._providers = collections.OrderedDict()
+        self._has_written = False
+
+    def primary(self):
+        self.use_primary()
+        return self._provider(self._primary).session()
+
+    def use_primary(self):
+        self._has_written = True
+
+    def session(self, object_type):
+        if self._has_written:
+            session_factory = self._primary
+        else:
+            session_factory = self._overrides.get(object_type, self._replica)
+        return self._provider(session_factory).session()
+
+    def _provider(self, session_factory):
+        provider = self._providers.get(session_factory)
+        if provider is None:
+            provider = self._providers.setdefault(session_factory, SessionProvider(session_factory))
+        return provider
+
+    def close(self):
+        for provider in self._providers.values():
+            provider.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
-def column_field(column, type=None, internal=False):
+def column_field(column, type=None, internal=False, cost=1):
     if type is None:
         type = _sql_column_to_graphql_type(column)
     return field(
         column=column,
         type=type,
         internal=internal,
+        cost=cost,
     )
 
 
 @join_builder
 def sql_value_join(local, target, join):
-    def build_query(parent_query, context):
-        return parent_query.with_entities(*(
-                local_field.column.label(remote_field.attr_name)
-                for local_field, remote_field in six.iteritems(join)
-            )) \
-            .with_session(local.__get_session__(context)) \
-            .all()
+    Value = collections.namedtuple("Value", [remote_field.attr_name for remote_field in join.values()])
+
+    def build_query(parent_query, context, parent_join_values=None):
+        if parent_join_values is None:
+            return parent_query.with_entities(*(
+                    local_field.column.label(remote_field.attr_name)
+                    for local_field, remote_field in six.iteritems(join)
+                )) \
+                .with_session(local.__get_session__(context)) \
+                .all()
+        else:
+            # The join values of the parents have already been fetched, so
+            # build the values from them rather than querying them again.
+            return [
+                Value(*(values[local_field.field_name] for local_field in join.keys()))
+                for values in parent_join_values
+            ]
 
     join_fields = dict(
         (local_field.field_name, remote_field.field_name)
         for local_field, remote_field in six.iteritems(join)
     )
 
-    return target, build_query, join_fields
+    return target, build_query, join_fields, {"parent_join_values": True}
 
 
 @join_builder
-def sql_join(local, target, join=None):
+def sql_join(local, target, join=None, order_by=None, paginate=False):
+    join = _sql_join_fields(local, target, join)
+    select_joined = _select_joined(target, join)
+
+    def build_query(parent_query, context):
+        query = select_joined(parent_query)
+        if order_by is not None:
+            query = query.order_by(*order_by)
+        return query
+
+    join_fields = dict(
+        (local_field.field_name, remote_field.field_name)
+        for local_field, remote_field in join.items()
+    )
+
+    # Values fetched by key are unordered, so only unordered joins can be
+    # batched
+    join_options = {"key_join": order_by is None}
+
+    if paginate:
+        partition_by = [remote_field.column for remote_field in join.values()]
+        if order_by is None:
+            position_order_by = list(target.__model__.__mapper__.primary_key)
+        else:
+            position_order_by = order_by
+
+        def filter_by_position(condition):
+            def refine_query(query, value, context):
+                if value is None:
+                    return query
+                else:
+                    return _filter_by_position(
+                        query,
+                        primary_key=target.__model__.__mapper__.primary_key,
+                        partition_by=partition_by,
+                        order_by=position_order_by,
+                        condition=lambda position: condition(position, value),
+                    )
+
+            return refine_query
+
+        # after is applied before first so that first counts positions
+        # among the values that remain
+        join_options["args"] = [
+            ("after", graphql.GraphQLInt, filter_by_position(lambda position, after: position > after)),
+            ("first", graphql.GraphQLInt, filter_by_position(lambda position, first: position <= first)),
+        ]
+
+    return target, build_query, join_fields, join_options
+
+
+def _sql_join_fields(local, target, join):
     if join is None:
         local_field_definition, remote_field_definition = _find_foreign_key(local, target)
         local_field = local_field_definition.field()
         remote_field = remote_field_definition.field()
-        join = {local_field: remote_field}
+        return {local_field: remote_field}
     else:
-        join = join.copy()
+        return join.copy()
 
-    if len(join) == 1:
-        remote_value_field, = join.values()
-        remote_value = remote_value_field.column
-    else:
-        remote_value = sqlalchemy.tuple_(*[
-            remote_value_field.column
-            for remote_value_field in join.values()
-        ])
 
-    def build_query(parent_query, context):
+def _select_joined(target, join):
+    remote_value = _row_value([remote_field.column for remote_field in join.values()])
+
+    def select_joined(parent_query):
         local_values = parent_query.with_entities(*[
             local_value_field.column
             for local_value_field in join.keys()
         ])
         return target.__select_all__().filter(remote_value.in_(local_values))
 
+    return select_joined
 
-    return target, build_query, dict(
-        (local_field.field_name, remote_field.field_name)
-        for local_field, remote_field in join.items()
+
+def sql_count(target, join=None):
+    return _sql_aggregate(
+        target,
+        aggregate=lambda: sqlalchemy.func.count(),
+        type=lambda: graphql.GraphQLNonNull(graphql.GraphQLInt),
+        default=0,
+        join=join,
+    )
+
+
+def sql_sum(target, column, join=None):
+    return _sql_column_aggregate(target, sqlalchemy.func.sum, column, join=join)
+
+
+def sql_min(target, column, join=None):
+    return _sql_column_aggregate(target, sqlalchemy.func.min, column, join=join)
+
+
+def sql_max(target, column, join=None):
+    return _sql_column_aggregate(target, sqlalchemy.func.max, column, join=join)
+
+
+def sql_exists(target, join=None):
+    return _sql_aggregate(
+        target,
+        aggregate=lambda: sqlalchemy.func.count() > 0,
+        type=lambda: graphql.GraphQLNonNull(graphql.GraphQLBoolean),
+        default=False,
+        join=join,
     )
 
 
+def _sql_column_aggregate(target, func, column, join):
+    return _sql_aggregate(
+        target,
+        aggregate=lambda: func(column),
+        type=lambda: _sql_type_to_graphql_type(column.type),
+        default=None,
+        join=join,
+    )
+
+
+def _sql_aggregate(target, aggregate, type, default, join):
+    # Each parent gets the aggregate of the values it joins onto, computed
+    # using a single GROUP BY query on the join columns. Parents that don't
+    # join onto any values get the default.
+    def relationship_type(target, build_query, **kwargs):
+        return graphjoiner.relationship(
+            target=target,
+            build_query=build_query,
+            process_results=lambda values: values[0] if values else default,
+            wrap_type=lambda graphql_type: graphql_type,
+            **kwargs
+        )
+
+    return declarative.relationship(
+        lambda: _sql_aggregate_join(target(), aggregate=aggregate(), type=type(), join=join),
+        relationship_type=relationship_type,
+    )
+
+
+@join_builder
+def _sql_aggregate_join(local, target, aggregate, type, join):
+    join = _sql_join_fields(local, target, join)
+    select_joined = _select_joined(target, join)
+    key_names = ["key{}".format(index) for index in range(len(join))]
+    key_columns = [remote_field.column for remote_field in join.values()]
+
+    def fields():
+        fields = dict(
+            (key_name, graphjoiner.field(type=remote_field.type, column=remote_field.column))
+            for key_name, remote_field in zip(key_names, join.values())
+        )
+        fields["value"] = graphjoiner.field(type=type, column=aggregate)
+        return fields
+
+    def fetch_immediates(selections, query, context):
+        return query \
+            .with_entities(*(selection.field.column for selection in selections)) \
+            .group_by(*key_columns) \
+            .with_session(target.__get_session__(context)) \
+            .all()
+
+    # Responses including aggregates are tagged with the target type, so
+    # invalidating the target also invalidates its aggregates.
+    aggregate_type = graphjoiner.JoinType(
+        name=target.__name__ + "Aggregate",
+        fetch_immediates=fetch_immediates,
+        fields=fields,
+        cache_tag=target.__graphjoiner__._cache_tag,
+    )
+
+    join_fields = dict(
+        (local_field.field_name, key_name)
+        for local_field, key_name in zip(join.keys(), key_names)
+    )
+
+    return _CoreType(graphjoiner.ScalarJoinType(aggregate_type, "value")), \
+        lambda parent_query, context: select_joined(parent_query), \
+        join_fields
+
+
+class _CoreType(object):
+    def __init__(self, value):
+        self.__graphjoiner__ = value
+
+
+def _filter_by_position(query, primary_key, partition_by, order_by, condition):
+    # Each value is numbered by its position amongst the values with the same
+    # parent, so values can be limited per parent in a single query.
+    position = sqlalchemy.func.row_number() \
+        .over(partition_by=partition_by, order_by=order_by) \
+        .label("_graphjoiner_position")
+    keys = [
+        column.label("_graphjoiner_key_{}".format(index))
+        for index, column in enumerate(primary_key)
+    ]
+    positions = query.with_entities(*(keys + [position])).order_by(None).subquery()
+    matching_keys = sqlalchemy.select([positions.c[key.name] for key in keys]) \
+        .where(condition(positions.c[position.name]))
+
+    if len(primary_key) == 1:
+        primary_key_value, = primary_key
+    else:
+        primary_key_value = sqlalchemy.tuple_(*primary_key)
+
+    return query.filter(primary_key_value.in_(matching_keys))
+
+
+def keyset_connection(target, order_by, default_page_size=20, max_page_size=100):
+    """Create a Relay-style connection to all values of target
+
+    The connection has first and after arguments. Values are ordered by the
+    columns in order_by, which must together be unique, and cursors encode
+    the values of those columns, so each page is selected using a
+    comparison on order_by rather than an offset. Columns may be ordered
+    using asc() or desc(), and must have types that can be encoded in a
+    cursor, such as integers, strings, dates and times. Pages have
+    default_page_size values unless first is set, which can be at most
+    max_page_size."""
+    return single(lambda: _select_keyset_page(
+        target(),
+        order_by=order_by,
+        default_page_size=default_page_size,
+        max_page_size=max_page_size,
+    ))
+
+
+@join_builder
+def _select_keyset_page(local, target, order_by, default_page_size, max_page_size):
+    cursor_codecs = [_cursor_codec(column) for column, _ in map(_order_by_column, order_by)]
+
+    def build_query(parent_query, context):
+        return _KeysetPage(target, order_by=order_by, first=default_page_size)
+
+    def refine_after(page, cursor, context):
+        if cursor is None:
+            return page
+        else:
+            return page.copy(after=_decode_cursor(cursor, cursor_codecs))
+
+    def refine_first(page, first, context):
+        if first is None:
+            return page
+        elif first < 0:
+            raise graphql.GraphQLError("first must not be negative")
+        elif max_page_size is not None and first > max_page_size:
+            raise graphql.GraphQLError("first must be at most {}".format(max_page_size))
+        else:
+            return page.copy(first=first)
+
+    def page_size(args):
+        first = args.get("first")
+        return default_page_size if first is None else first
+
+    args = [
+        ("after", graphql.GraphQLString, refine_after),
+        ("first", graphql.GraphQLInt, refine_first),
+    ]
+
+    # The edges of each page are costed using the page size, since first is
+    # an argument of the connection rather than of the edges.
+    return _connection_type(target), build_query, {}, {"args": args, "child_list_size": page_size}
+
+
+class _KeysetPage(object):
+    def __init__(self, target, order_by, first, after=None):
+        self.target = target
+        self.order_by = order_by
+        self.first = first
+        self.after = after
+        self.columns = [_order_by_column(clause) for clause in order_by]
+        self.cursor_codecs = [_cursor_codec(column) for column, _ in self.columns]
+
+    def copy(self, **kwargs):
+        attrs = dict(target=self.target, order_by=self.order_by, first=self.first, after=self.after)
+        attrs.update(kwargs)
+        return _KeysetPage(**attrs)
+
+    def query(self, limit):
+        query = self.target.__select_all__()
+        if self.after is not None:
+            query = query.filter(_after_keyset(self.columns, self.after))
+        return query.order_by(*self.order_by).limit(limit)
+
+    def rows(self, columns, limit, context):
+        return self.query(limit) \
+            .with_entities(*columns) \
+            .with_session(self.target.__get_session__(context)) \
+            .all()
+
+    def cursor_columns(self):
+        return [column for column, _ in self.columns]
+
+
+def _order_by_column(clause):
+    # Returns the ordered column, and whether it's in descending order
+    modifier = getattr(clause, "modifier", None)
+    if modifier is sqlalchemy.sql.operators.asc_op:
+        return clause.element, False
+    elif modifier is sqlalchemy.sql.operators.desc_op:
+        return clause.element, True
+    elif modifier is None:
+        return clause, False
+    else:
+        raise ValueError("Unsupported order_by for keyset connection: {}".format(clause))
+
+
+def _after_keyset(columns, values):
+    directions = set(descending for _, descending in columns)
+    if len(directions) == 1:
+        descending, = directions
+        keyset = _row_value([keyset_column for keyset_column, _ in columns])
+        after = _row_value([
+            sqlalchemy.literal(value, type_=keyset_column.type)
+            for (keyset_column, _), value in zip(columns, values)
+        ])
+        return keyset < after if descending else keyset > after
+    else:
+        # Row values can only be compared in a single direction, so mixed
+        # directions are compared one column at a time.
+        return sqlalchemy.or_(*(
+            sqlalchemy.and_(*(
+                [
+                    previous_column == previous_value
+                    for (previous_column, _), previous_value in zip(columns[:index], values)
+                ] +
+                [column < value if descending else column > value]
+            ))
+            for index, ((column, descending), value) in enumerate(zip(columns, values))
+        ))
+
+
+def _row_value(values):
+    if len(values) == 1:
+        value, = values
+        return value
+    else:
+        return sqlalchemy.tuple_(*values)
+
+
+def _encode_cursor(codecs, values):
+    encoded = [
+        None if value is None else codec.encode(value)
+        for codec, value in zip(codecs, values)
+    ]
+    return base64.urlsafe_b64encode(json.dumps(encoded).encode("utf8")).decode("ascii")
+
+
+def _decode_cursor(cursor, codecs):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf8"))
+        if isinstance(values, list) and len(values) == len(codecs):
+            return [
+                None if value is None else codec.decode(value)
+                for codec, value in zip(codecs, values)
+            ]
+    except (TypeError, ValueError, decimal.InvalidOperation):
+        pass
+
+    raise graphql.GraphQLError("Invalid cursor: {}".format(cursor))
+
+
+_CursorCodec = collections.namedtuple("_CursorCodec", ["encode", "decode"])
+
+
+def _identity(value):
+    return value
+
+
+class _UTC(datetime.tzinfo):
+    def utcoffset(self, value):
+        return datetime.timedelta(0)
+
+    def tzname(self, value):
+        return "UTC"
+
+    def dst(self, value):
+        return datetime.timedelta(0)
+
+
+_utc = _UTC()
+_datetime_format = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def _encode_datetime(value):
+    # Datetimes with a timezone are encoded in UTC, marked with a "Z"
+    if value.tzinfo is None or value.utcoffset() is None:
+        return value.strftime(_datetime_format)
+    else:
+        return (value - value.utcoffset()).replace(tzinfo=None).strftime(_datetime_format) + "Z"
+
+
+def _decode_datetime(value):
+    if value.endswith("Z"):
+        return datetime.datetime.strptime(value[:-1], _datetime_format).replace(tzinfo=_utc)
+    else:
+        return datetime.datetime.strptime(value, _datetime_format)
+
+
+_cursor_codecs = {
+    datetime.datetime: _CursorCodec(_encode_datetime, _decode_datetime),
+    datetime.date: _CursorCodec(
+        lambda value: value.isoformat(),
+        lambda value: datetime.datetime.strptime(value, "%Y-%m-%d").date(),
+    ),
+    decimal.Decimal: _CursorCodec(str, decimal.Decimal),
+    uuid.UUID: _CursorCodec(str, uuid.UUID),
+}
+_cursor_codecs.update(
+    (json_type, _CursorCodec(_identity, _identity))
+    for json_type in (bool, float, str) + six.integer_types + six.string_types
+)
+
+
+def _cursor_codec(column):
+    # Values are encoded in cursors as JSON, so values of other types are
+    # converted using the Python type of the column
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+
+    codec = _cursor_codecs.get(python_type)
+    if codec is None:
+        raise ValueError("Unsupported type of order_by column for keyset connection: {}".format(column.type))
+    return codec
+
+
+_connection_types = weakref.WeakKeyDictionary()
+
+def _connection_type(target):
+    connection_type = _connection_types.get(target)
+    if connection_type is None:
+        connection_type = _connection_types[target] = _create_connection_type(target)
+    return connection_type
+
+
+def _create_connection_type(target):
+    primary_key = target.__model__.__mapper__.primary_key
+
+    def fetch_edges(selections, page, context):
+        rows = page.rows(page.cursor_columns() + list(primary_key), limit=page.first, context=context)
+        order_by_length = len(page.order_by)
+        values = [
+            dict(
+                [("cursor", _encode_cursor(page.cursor_codecs, row[:order_by_length]))] +
+                [("key_{}".format(index), value) for index, value in enumerate(row[order_by_length:])]
+            )
+            for row in rows
+        ]
+        return [
+            tuple(value[selection.field.attr_name] for selection in selections)
+            for value in values
+        ]
+
+    edge_attrs = dict(
+        ("key_{}".format(index), field(type=_sql_column_to_graphql_type(column), internal=True))
+        for index, column in enumerate(primary_key)
+    )
+    edge_attrs.update(
+        __select_all__=staticmethod(lambda: None),
+        __fetch_immediates__=staticmethod(fetch_edges),
+        cursor=field(type=graphql.GraphQLNonNull(graphql.GraphQLString)),
+        node=single(lambda: select(
+            target,
+            join_query=lambda page, target_query: page.query(limit=page.first),
+            join_fields=dict(
+                (getattr(edge, "key_{}".format(index)), _find_field_for_column(target, column).field())
+                for index, column in enumerate(primary_key)
+            ),
+        )),
+    )
+    edge = type(ObjectType)(target.__name__ + "Edge", (ObjectType, ), edge_attrs)
+    page_info = _create_page_info_type(target)
+
+    return type(ObjectType)(target.__name__ + "Connection", (ObjectType, ), dict(
+        __select_all__=staticmethod(lambda: None),
+        __fetch_immediates__=staticmethod(lambda selections, page, context: [()]),
+        edges=many(lambda: select(edge, join_query=lambda page, edge_query: page)),
+        page_info=single(lambda: select(page_info, join_query=lambda page, page_info_query: page)),
+    ))
+
+
+def _create_page_info_type(target):
+    def fetch_immediates(selections, page, context):
+        # One more row than requested is fetched to find out whether there's
+        # a next page
+        rows = page.rows(page.cursor_columns(), limit=page.first + 1, context=context)
+        has_next_page = len(rows) > page.first
+        rows = rows[:page.first]
+
+        values = dict(
+            has_next_page=has_next_page,
+            has_previous_page=page.after is not None,
+            start_cursor=_encode_cursor(page.cursor_codecs, rows[0]) if rows else None,
+            end_cursor=_encode_cursor(page.cursor_codecs, rows[-1]) if rows else None,
+        )
+        return [tuple(values[selection.field.attr_name] for selection in selections)]
+
+    # Each connection has its own type of page info, named after its target
+    # like its edges, so that it can't clash with types defined elsewhere.
+    return type(ObjectType)(target.__name__ + "PageInfo", (ObjectType, ), dict(
+        __select_all__=staticmethod(lambda: None),
+        __fetch_immediates__=staticmethod(fetch_immediates),
+        has_next_page=field(type=graphql.GraphQLNonNull(graphql.GraphQLBoolean)),
+        has_previous_page=field(type=graphql.GraphQLNonNull(graphql.GraphQLBoolean)),
+        start_cursor=field(type=graphql.GraphQLString),
+        end_cursor=field(type=graphql.GraphQLString),
+    ))
+
+
+def _columns_in(columns, values):
+    if len(columns) == 1:
+        column, = columns
+        return column.in_([value for value, in values])
+    else:
+        return sqlalchemy.tuple_(*columns).in_(values)
+
+
 def _find_foreign_key(local, target):
     foreign_keys = list(_find_join_candidates(local, target))
     if len(foreign_keys) == 1:
@@ -117,30 +863,48 @@ def _find_join_candidates(local, target):
 def _find_join_candidates_directional(local, remote):
     remote_tables = sqlalchemy.inspect(remote.__model__).tables
 
-    for field_definition in _get_simple_field_definitions(local):
-        orm_column = field_definition._kwargs.get("column")
-        if orm_column is not None and hasattr(orm_column, "property"):
-            columns = orm_column.property.columns
-            if len(columns) == 1:
-                column, = columns
-                for foreign_key in column.foreign_keys:
-                    if foreign_key.column.table in remote_tables:
-                        remote_field = _find_field_for_column(remote, foreign_key.column)
-                        yield field_definition, remote_field
+    for field_definition, foreign_key in _column_index(local).foreign_keys:
+        if foreign_key.column.table in remote_tables:
+            remote_field = _find_field_for_column(remote, foreign_key.column)
+            yield field_definition, remote_field
 
 
 def _find_field_for_column(cls, column):
-    fields = [
-        field_definition
-        for field_definition in _get_simple_field_definitions(cls)
-        if "column" in field_definition._kwargs and field_definition._kwargs["column"] == column
-    ]
+    fields = _column_index(cls).fields_by_column.get(column, [])
 
     if len(fields) == 1:
         return fields[0]
     else:
         raise Exception("Could not find unique field in {} for {}".format(cls.__name__, column))
 
+
+_column_indexes = weakref.WeakKeyDictionary()
+
+def _column_index(cls):
+    index = _column_indexes.get(cls)
+    if index is None:
+        index = _column_indexes[cls] = _ColumnIndex(cls)
+    return index
+
+
+class _ColumnIndex(object):
+    def __init__(self, cls):
+        self.foreign_keys = []
+        self.fields_by_column = {}
+
+        for field_definition in _get_simple_field_definitions(cls):
+            orm_column = field_definition._kwargs.get("column")
+            if orm_column is not None and hasattr(orm_column, "property"):
+                columns = orm_column.property.columns
+                if len(columns) == 1:
+                    column, = columns
+                    self.fields_by_column.setdefault(column, []).append(field_definition)
+                    for foreign_key in column.foreign_keys:
+                        self.foreign_keys.append((field_definition, foreign_key))
+            elif orm_column is not None:
+                self.fields_by_column.setdefault(orm_column, []).append(field_definition)
+
+
 def _get_simple_field_definitions(cls):
     for field_key, field_definition in get_field_definitions(cls):
         if isinstance(field_definition, declarative.SimpleFieldDefinition):
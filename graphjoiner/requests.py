@@ -1,12 +1,13 @@
 import collections
 from copy import copy
 
+from graphql import GraphQLError
 from graphql.language import ast as ast_types
 from graphql.execution.values import get_argument_values
 from graphql.type.directives import GraphQLIncludeDirective, GraphQLSkipDirective
-from six.moves import filter
+from graphql.utils.get_operation_ast import get_operation_ast
 
-from .util import find, single
+from .util import find
 
 
 class DocumentRequest(object):
@@ -37,16 +38,14 @@ class Request(object):
         return Request(**attrs)
 
 
-def request_from_graphql_document(document, query_root, mutation_root, context, variables):
+def request_from_graphql_document(document, query_root, mutation_root, context, variables, operation_name=None):
     fragments = dict(
         (definition.name.value, definition)
         for definition in document.definitions
         if isinstance(definition, ast_types.FragmentDefinition)
     )
-    definition_index, operation = single(list(filter(
-        lambda pair: isinstance(pair[1], ast_types.OperationDefinition),
-        enumerate(document.definitions)
-    )))
+    operation = get_operation(document, operation_name)
+    definition_index = document.definitions.index(operation)
 
     if operation.operation == "mutation":
         root = mutation_root
@@ -75,6 +74,16 @@ def request_from_graphql_document(document, query_root, mutation_root, context,
     )
 
 
+def get_operation(document, operation_name):
+    operation = get_operation_ast(document, operation_name)
+    if operation is not None:
+        return operation
+    elif operation_name is None:
+        raise GraphQLError("Must provide operation name if query contains multiple operations.")
+    else:
+        raise GraphQLError('Unknown operation named "{}".'.format(operation_name))
+
+
 def request_from_graphql_ast(ast, root, context, variables, field, fragments):
     if isinstance(ast, ast_types.Field):
         key = field_key(ast)
@@ -1,3 +1,5 @@
+import threading
+
 import attr
 from graphql import GraphQLField, GraphQLInterfaceType, GraphQLNonNull, GraphQLString
 from hamcrest import all_of, assert_that, contains, contains_inanyorder, equal_to, has_properties, has_string, instance_of, starts_with
@@ -201,6 +203,391 @@ def test_query_builder_can_use_context():
     }))
 
 
+def _create_authors_root():
+    AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+    fetches = []
+
+    class Author(StaticDataObjectType):
+        __records__ = [AuthorRecord(1, "PG Wodehouse"), AuthorRecord(2, "Joseph Heller")]
+
+        id = field(type=Int)
+        name = field(type=String)
+
+        @classmethod
+        def __fetch_immediates__(cls, selections, records, context):
+            fetches.append([selection.field.attr_name for selection in selections])
+            return super(Author, cls).__fetch_immediates__(selections, records, context)
+
+    class Root(RootType):
+        authors = many(lambda: StaticDataObjectType.select(Author))
+
+        @authors.arg("id", Int)
+        def authors_arg_id(records, author_id):
+            return [record for record in records if record.id == author_id]
+
+    return Root, fetches
+
+
+class TestDuplicateRelationshipSelections(object):
+    def test_aliases_of_same_relationship_are_fetched_once(self):
+        Root, fetches = _create_authors_root()
+
+        result = executor(Root)("""{
+            a: authors { name }
+            b: authors { id }
+        }""")
+
+        assert_that(result, is_successful_result(data={
+            "a": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}],
+            "b": [{"id": 1}, {"id": 2}],
+        }))
+        assert_that(fetches, equal_to([["name", "id"]]))
+
+    def test_relationships_selected_by_fragments_are_fetched_once(self):
+        Root, fetches = _create_authors_root()
+
+        result = executor(Root)("""{
+            authors { name }
+            ...Authors
+        }
+
+        fragment Authors on Root {
+            other: authors { id name }
+        }""")
+
+        assert_that(result, is_successful_result(data={
+            "authors": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}],
+            "other": [{"id": 1, "name": "PG Wodehouse"}, {"id": 2, "name": "Joseph Heller"}],
+        }))
+        assert_that(fetches, equal_to([["name", "id"]]))
+
+    def test_relationships_with_different_arguments_are_fetched_separately(self):
+        Root, fetches = _create_authors_root()
+
+        result = executor(Root)("""{
+            a: authors(id: 1) { name }
+            b: authors(id: 2) { name }
+        }""")
+
+        assert_that(result, is_successful_result(data={
+            "a": [{"name": "PG Wodehouse"}],
+            "b": [{"name": "Joseph Heller"}],
+        }))
+        assert_that(fetches, equal_to([["name"], ["name"]]))
+
+    def test_relationships_with_conflicting_sub_selections_are_fetched_separately(self):
+        Root, fetches = _create_authors_root()
+
+        result = executor(Root)("""{
+            a: authors { value: name }
+            b: authors { value: id }
+        }""")
+
+        assert_that(result, is_successful_result(data={
+            "a": [{"value": "PG Wodehouse"}, {"value": "Joseph Heller"}],
+            "b": [{"value": 1}, {"value": 2}],
+        }))
+        assert_that(fetches, equal_to([["name"], ["id"]]))
+
+
+class TestBatchedRelationshipFetches(object):
+    def test_key_joins_to_same_type_from_different_parents_are_fetched_once(self):
+        Root, fetches = self._create_root()
+
+        result = executor(Root)("""{
+            books { title author { name } }
+            reviews { body author { name } }
+        }""")
+
+        assert_that(result, is_successful_result(data={
+            "books": [
+                {"title": "Leave It to Psmith", "author": {"name": "PG Wodehouse"}},
+                {"title": "Catch-22", "author": {"name": "Joseph Heller"}},
+            ],
+            "reviews": [
+                {"body": "Funny", "author": {"name": "Joseph Heller"}},
+                {"body": "Funnier", "author": {"name": "Joseph Heller"}},
+            ],
+        }))
+        assert_that(fetches, equal_to([("keys", [1, 2])]))
+
+    def test_key_joins_with_different_selections_are_fetched_separately(self):
+        Root, fetches = self._create_root()
+
+        result = executor(Root)("""{
+            books { author { name } }
+            reviews { author { id } }
+        }""")
+
+        assert_that(result, is_successful_result(data={
+            "books": [{"author": {"name": "PG Wodehouse"}}, {"author": {"name": "Joseph Heller"}}],
+            "reviews": [{"author": {"id": 2}}, {"author": {"id": 2}}],
+        }))
+        assert_that(fetches, equal_to([("all", ), ("all", )]))
+
+    def _create_root(self):
+        AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+        BookRecord = attr.make_class("BookRecord", ["title", "author_id"])
+        ReviewRecord = attr.make_class("ReviewRecord", ["body", "author_id"])
+        fetches = []
+
+        class Author(StaticDataObjectType):
+            __records__ = [AuthorRecord(1, "PG Wodehouse"), AuthorRecord(2, "Joseph Heller")]
+
+            id = field(type=Int)
+            name = field(type=String)
+
+            @classmethod
+            def __select_all__(cls):
+                return ("all", ), cls.__records__
+
+            @classmethod
+            def __select_by_keys__(cls, fields, keys, context):
+                ids = [author_id for author_id, in keys]
+                return ("keys", ids), [record for record in cls.__records__ if record.id in ids]
+
+            @classmethod
+            def __fetch_immediates__(cls, selections, query, context):
+                description, records = query
+                fetches.append(description)
+                return super(Author, cls).__fetch_immediates__(selections, records, context)
+
+        class Book(StaticDataObjectType):
+            __records__ = [BookRecord("Leave It to Psmith", 1), BookRecord("Catch-22", 2)]
+
+            title = field(type=String)
+            author_id = field(type=Int)
+            author = single(lambda: select(Author, join_fields={Book.author_id: Author.id}))
+
+        class Review(StaticDataObjectType):
+            __records__ = [ReviewRecord("Funny", 2), ReviewRecord("Funnier", 2)]
+
+            body = field(type=String)
+            author_id = field(type=Int)
+            author = single(lambda: select(Author, join_fields={Review.author_id: Author.id}))
+
+        class Root(RootType):
+            books = many(lambda: StaticDataObjectType.select(Book))
+            reviews = many(lambda: StaticDataObjectType.select(Review))
+
+        return Root, fetches
+
+
+class TestFetchImmediatesByKeys(object):
+    def test_key_joins_look_up_values_by_key(self):
+        Root, lookups = self._create_root()
+
+        result = executor(Root)("{ books { title author { name } } }")
+
+        assert_that(result, is_successful_result(data={
+            "books": [
+                {"title": "Leave It to Psmith", "author": {"name": "PG Wodehouse"}},
+                {"title": "Right Ho, Jeeves", "author": {"name": "PG Wodehouse"}},
+                {"title": "Catch-22", "author": {"name": "Joseph Heller"}},
+            ],
+        }))
+        assert_that(lookups, equal_to([[(1, ), (2, )]]))
+
+    def test_parents_without_join_values_are_not_looked_up(self):
+        Root, lookups = self._create_root()
+
+        result = executor(Root)("{ reviews { body author { name } } }")
+
+        assert_that(result, is_successful_result(data={
+            "reviews": [{"body": "Anonymous", "author": None}],
+        }))
+        assert_that(lookups, equal_to([]))
+
+    def _create_root(self):
+        AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+        BookRecord = attr.make_class("BookRecord", ["title", "author_id"])
+        ReviewRecord = attr.make_class("ReviewRecord", ["body", "author_id"])
+        lookups = []
+
+        class Author(StaticDataObjectType):
+            __records__ = [AuthorRecord(1, "PG Wodehouse"), AuthorRecord(2, "Joseph Heller")]
+
+            id = field(type=Int)
+            name = field(type=String)
+
+            @classmethod
+            def __fetch_immediates_by_keys__(cls, selections, fields, keys, context):
+                lookups.append(keys)
+                records_by_id = dict((record.id, record) for record in cls.__records__)
+                return [
+                    cls.__fetch_immediates__(selections, [records_by_id[author_id]], context)
+                    for author_id, in keys
+                ]
+
+        class Book(StaticDataObjectType):
+            __records__ = [
+                BookRecord("Leave It to Psmith", 1),
+                BookRecord("Right Ho, Jeeves", 1),
+                BookRecord("Catch-22", 2),
+            ]
+
+            title = field(type=String)
+            author_id = field(type=Int)
+            author = single(lambda: select(Author, join_fields={Book.author_id: Author.id}))
+
+        class Review(StaticDataObjectType):
+            __records__ = [ReviewRecord("Anonymous", None)]
+
+            body = field(type=String)
+            author_id = field(type=Int)
+            author = single_or_null(lambda: select(Author, join_fields={Review.author_id: Author.id}))
+
+        class Root(RootType):
+            books = many(lambda: StaticDataObjectType.select(Book))
+            reviews = many(lambda: StaticDataObjectType.select(Review))
+
+        return Root, lookups
+
+
+class TestFetchConcurrency(object):
+    def test_root_fields_are_fetched_concurrently(self):
+        Root, waits = self._create_root()
+
+        result = executor(Root, fetch_concurrency=2)("{ books { title } authors { name } }")
+
+        assert_that(result, is_successful_result(data={
+            "books": [{"title": "Leave It to Psmith"}],
+            "authors": [{"name": "PG Wodehouse"}],
+        }))
+        assert_that(waits, equal_to([True]))
+
+    def test_root_fields_are_fetched_one_after_another_by_default(self):
+        Root, waits = self._create_root(timeout=0.01)
+
+        executor(Root)("{ books { title } authors { name } }")
+
+        assert_that(waits, equal_to([False]))
+
+    def test_relationships_of_concurrently_fetched_fields_are_fetched(self):
+        Root, _ = self._create_root()
+
+        result = executor(Root, fetch_concurrency=2)("{ books { author { name } } authors { name } }")
+
+        assert_that(result, is_successful_result(data={
+            "books": [{"author": {"name": "PG Wodehouse"}}],
+            "authors": [{"name": "PG Wodehouse"}],
+        }))
+
+    def _create_root(self, timeout=5):
+        AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+        BookRecord = attr.make_class("BookRecord", ["title", "author_id"])
+        authors_fetched = threading.Event()
+        waits = []
+
+        class Author(StaticDataObjectType):
+            __records__ = [AuthorRecord(1, "PG Wodehouse")]
+
+            id = field(type=Int)
+            name = field(type=String)
+
+            @classmethod
+            def __fetch_immediates__(cls, selections, records, context):
+                authors_fetched.set()
+                return super(Author, cls).__fetch_immediates__(selections, records, context)
+
+        class Book(StaticDataObjectType):
+            __records__ = [BookRecord("Leave It to Psmith", 1)]
+
+            title = field(type=String)
+            author_id = field(type=Int)
+            author = single(lambda: StaticDataObjectType.select(Author, join={Book.author_id: Author.id}))
+
+            @classmethod
+            def __fetch_immediates__(cls, selections, records, context):
+                if not waits:
+                    waits.append(authors_fetched.wait(timeout))
+                return super(Book, cls).__fetch_immediates__(selections, records, context)
+
+        class Root(RootType):
+            books = many(lambda: StaticDataObjectType.select(Book))
+            authors = many(lambda: StaticDataObjectType.select(Author))
+
+        return Root, waits
+
+
+class TestExecuteBatch(object):
+    def test_each_operation_has_its_own_result(self):
+        Root, _ = _create_authors_root()
+
+        results = executor(Root).batch([
+            {"query": "{ authors { name } }"},
+            {"query": "query ($id: Int) { authors(id: $id) { id } }", "variables": {"id": 2}},
+        ])
+
+        assert_that(results, contains(
+            is_successful_result(data={"authors": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}]}),
+            is_successful_result(data={"authors": [{"id": 2}]}),
+        ))
+
+    def test_same_relationships_in_different_operations_are_fetched_once(self):
+        Root, fetches = _create_authors_root()
+
+        results = executor(Root).batch([
+            {"query": "{ authors { name } }"},
+            {"query": "{ writers: authors { id } }"},
+        ])
+
+        assert_that(results, contains(
+            is_successful_result(data={"authors": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}]}),
+            is_successful_result(data={"writers": [{"id": 1}, {"id": 2}]}),
+        ))
+        assert_that(fetches, equal_to([["name", "id"]]))
+
+    def test_invalid_operations_do_not_affect_other_operations(self):
+        Root, _ = _create_authors_root()
+
+        results = executor(Root).batch([
+            {"query": "{ authors { title } }"},
+            {"query": "{ authors { name } }"},
+        ])
+
+        assert_that(results, contains(
+            is_invalid_result(errors=contains(has_string(starts_with('Cannot query field "title"')))),
+            is_successful_result(data={"authors": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}]}),
+        ))
+
+
+class TestOperationName(object):
+    _query = """
+        query Names { authors { name } }
+        query Ids { authors { id } }
+    """
+
+    def test_operation_is_selected_by_name(self):
+        Root, _ = _create_authors_root()
+        execute = executor(Root)
+
+        assert_that(execute(self._query, operation_name="Ids"), is_successful_result(data={
+            "authors": [{"id": 1}, {"id": 2}],
+        }))
+        assert_that(execute(self._query, operation_name="Names"), is_successful_result(data={
+            "authors": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}],
+        }))
+
+    def test_operation_name_is_required_when_document_has_multiple_operations(self):
+        Root, _ = _create_authors_root()
+
+        result = executor(Root)(self._query)
+
+        assert_that(result, is_invalid_result(errors=contains(
+            has_string("Must provide operation name if query contains multiple operations."),
+        )))
+
+    def test_error_if_there_is_no_operation_with_operation_name(self):
+        Root, _ = _create_authors_root()
+
+        result = executor(Root)(self._query, operation_name="Titles")
+
+        assert_that(result, is_invalid_result(errors=contains(
+            has_string('Unknown operation named "Titles".'),
+        )))
+
+
 def test_can_extract_fields_from_relationships():
     AuthorRecord = attr.make_class("AuthorRecord", ["name"])
 
@@ -254,6 +641,47 @@ def test_can_extract_fields_from_relationships_using_field():
     }))
 
 
+def test_extracted_fields_are_fetched_with_only_join_fields():
+    AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+    BookRecord = attr.make_class("BookRecord", ["title", "summary", "author_id"])
+    fetches = []
+
+    class Author(StaticDataObjectType):
+        __records__ = [AuthorRecord(1, "PG Wodehouse"), AuthorRecord(2, "Joseph Heller")]
+
+        id = field(type=Int)
+        name = field(type=String)
+        books = many(lambda: StaticDataObjectType.select(Book, join={Author.id: Book.author_id}))
+        book_titles = extract(books, lambda: Book.title)
+
+    class Book(StaticDataObjectType):
+        __records__ = [
+            BookRecord("Leave It to Psmith", "Psmith poses as a poet.", 1),
+            BookRecord("Right Ho, Jeeves", "Bertie plays Cupid.", 1),
+        ]
+
+        title = field(type=String)
+        summary = field(type=String)
+        author_id = field(type=Int)
+
+        @classmethod
+        def __fetch_immediates__(cls, selections, records, context):
+            fetches.append([selection.field.attr_name for selection in selections])
+            return super(Book, cls).__fetch_immediates__(selections, records, context)
+
+    class Root(RootType):
+        authors = many(lambda: StaticDataObjectType.select(Author))
+
+    result = executor(Root)("{ authors { name bookTitles } }")
+    assert_that(result, is_successful_result(data={
+        "authors": [
+            {"name": "PG Wodehouse", "bookTitles": ["Leave It to Psmith", "Right Ho, Jeeves"]},
+            {"name": "Joseph Heller", "bookTitles": []},
+        ],
+    }))
+    assert_that(fetches, equal_to([["title", "author_id"]]))
+
+
 def test_can_implement_graphql_core_interfaces():
     HasName = GraphQLInterfaceType("HasName", fields={
         "name": GraphQLField(GraphQLString),
@@ -461,6 +889,26 @@ def test_can_query_fields_extracted_from_internal_fields():
     )
 
 
+def test_internal_relationships_are_built_when_executor_is_created():
+    built = []
+
+    class Book(StaticDataObjectType):
+        __records__ = []
+        title = field(type=String)
+
+    def select_books():
+        built.append(Book)
+        return StaticDataObjectType.select(Book)
+
+    class Root(RootType):
+        books = many(select_books, internal=True)
+        value = field(type=Int)
+
+    executor(Root)
+
+    assert_that(built, equal_to([Book]))
+
+
 def test_field_set_can_be_used_to_declare_multiple_fields_in_one_attribute():
     AuthorRecord = attr.make_class("AuthorRecord", ["name"])
     BookRecord = attr.make_class("BookRecord", ["title"])
@@ -1,8 +1,11 @@
+import time
+
 import attr
-from graphql import GraphQLInt, GraphQLNonNull
-from hamcrest import assert_that
+from graphql import GraphQLInt, GraphQLNonNull, GraphQLString
+from hamcrest import assert_that, contains, equal_to, has_length
 
-from graphjoiner.declarative import executor, field, single, RootType, select, ObjectType, Mutation, mutation_field
+from graphjoiner.caches import InMemoryCache
+from graphjoiner.declarative import executor, field, invalidate, many, single, RootType, select, ObjectType, Mutation, mutation_field
 from ..matchers import is_successful_result
 
 
@@ -73,3 +76,265 @@ def test_mutations_are_executed_serially():
             "value": 2,
         },
     }))
+
+
+def test_sub_selections_of_mutations_are_fetched_before_next_mutation():
+    BoxRecord = attr.make_class("Box", ["value"])
+
+    box = BoxRecord(0)
+
+    class Box(StaticDataObjectType):
+        __records__ = [box]
+
+        value = field(type=GraphQLInt)
+
+    class BoxMutation(Mutation, ObjectType):
+        __args__ = {
+            "value": GraphQLNonNull(GraphQLInt),
+        }
+
+        snapshot = single(lambda: select(Box))
+
+        @classmethod
+        def __mutate__(cls, selections, query, context):
+            box.value = query["value"]
+            return [()]
+
+    class MutationRoot(RootType):
+        update_box = mutation_field(lambda: BoxMutation)
+
+    class Root(RootType):
+        box = single(lambda: select(Box))
+
+    result = executor(Root, mutation=MutationRoot)("""
+        mutation {
+            first: updateBox(value: 1) { snapshot { value } }
+            second: updateBox(value: 2) { snapshot { value } }
+        }
+    """)
+    assert_that(result, is_successful_result(data={
+        "first": {"snapshot": {"value": 1}},
+        "second": {"snapshot": {"value": 2}},
+    }))
+
+
+def test_mutations_are_executed_serially_when_fetching_concurrently():
+    BoxRecord = attr.make_class("Box", ["value"])
+
+    box = BoxRecord(0)
+    active = []
+    overlaps = []
+
+    class Box(StaticDataObjectType):
+        __records__ = [box]
+
+        value = field(type=GraphQLInt)
+
+    class BoxMutation(Mutation, ObjectType):
+        __args__ = {
+            "value": GraphQLNonNull(GraphQLInt),
+        }
+
+        value = field(type=GraphQLInt)
+
+        @classmethod
+        def __mutate__(cls, selections, query, context):
+            overlaps.append(bool(active))
+            active.append(query["value"])
+            time.sleep(0.01)
+            box.value = query["value"]
+            active.remove(query["value"])
+            return Box.__fetch_immediates__(selections, [box], context)
+
+    class MutationRoot(RootType):
+        update_box = mutation_field(lambda: BoxMutation)
+
+    class Root(RootType):
+        box = single(lambda: select(Box))
+
+    result = executor(Root, mutation=MutationRoot, fetch_concurrency=4)("""
+        mutation {
+            first: updateBox(value: 1) { value }
+            second: updateBox(value: 2) { value }
+            third: updateBox(value: 3) { value }
+        }
+    """)
+    assert_that(result, is_successful_result(data={
+        "first": {"value": 1},
+        "second": {"value": 2},
+        "third": {"value": 3},
+    }))
+    assert_that(overlaps, equal_to([False, False, False]))
+
+
+def test_each_alias_of_mutation_field_is_mutated():
+    BookRecord = attr.make_class("Book", ["id", "title"])
+
+    books = []
+
+    class BookFields(object):
+        id = field(type=GraphQLInt)
+
+    class Book(StaticDataObjectType, BookFields):
+        __records__ = books
+
+    class CreateBook(Mutation, ObjectType, BookFields):
+        __args__ = {
+            "title": GraphQLNonNull(GraphQLString),
+        }
+
+        @classmethod
+        def __mutate__(cls, selections, query, context):
+            book = BookRecord(len(books) + 1, query["title"])
+            books.append(book)
+            return Book.__fetch_immediates__(selections, [book], context)
+
+    class MutationRoot(RootType):
+        create_book = mutation_field(lambda: CreateBook)
+
+    class Root(RootType):
+        books = many(lambda: select(Book))
+
+    result = executor(Root, mutation=MutationRoot)("""
+        mutation {
+            a: createBook(title: "x") { id }
+            b: createBook(title: "x") { id }
+        }
+    """)
+    assert_that(result, is_successful_result(data={
+        "a": {"id": 1},
+        "b": {"id": 2},
+    }))
+    assert_that(books, has_length(2))
+
+
+def test_batched_operations_observe_earlier_mutations():
+    BoxRecord = attr.make_class("Box", ["value"])
+
+    box = BoxRecord(0)
+
+    class Box(StaticDataObjectType):
+        __records__ = [box]
+
+        value = field(type=GraphQLInt)
+
+    class BoxMutation(Mutation, ObjectType):
+        __args__ = {
+            "value": GraphQLNonNull(GraphQLInt),
+        }
+
+        value = field(type=GraphQLInt)
+
+        @classmethod
+        def __mutate__(cls, selections, query, context):
+            box.value = query["value"]
+            return Box.__fetch_immediates__(selections, [box], context)
+
+    class MutationRoot(RootType):
+        update_box = mutation_field(lambda: BoxMutation)
+
+    class Root(RootType):
+        box = single(lambda: select(Box))
+
+    results = executor(Root, mutation=MutationRoot).batch([
+        {"query": "{ box { value } }"},
+        {"query": "mutation { updateBox(value: 1) { value } }"},
+        {"query": "{ box { value } }"},
+    ])
+    assert_that(results, contains(
+        is_successful_result(data={"box": {"value": 0}}),
+        is_successful_result(data={"updateBox": {"value": 1}}),
+        is_successful_result(data={"box": {"value": 1}}),
+    ))
+
+
+class TestCacheInvalidation(object):
+    def test_mutation_invalidates_cached_responses_for_affected_types(self):
+        execute = self._create_executor(invalidates=lambda Box, args: [invalidate(Box)])
+
+        execute("{ box { value } }")
+        execute("mutation { updateBox(value: 1) { value } }")
+
+        assert_that(execute("{ box { value } }"), is_successful_result(data={
+            "box": {"value": 1},
+        }))
+
+    def test_cached_responses_are_not_invalidated_without_declared_invalidation(self):
+        execute = self._create_executor(invalidates=lambda Box, args: [])
+
+        execute("{ box { value } }")
+        execute("mutation { updateBox(value: 1) { value } }")
+
+        assert_that(execute("{ box { value } }"), is_successful_result(data={
+            "box": {"value": 0},
+        }))
+
+    def test_mutation_invalidates_cached_entities_with_affected_keys(self):
+        execute = self._create_executor(
+            invalidates=lambda Box, args: [invalidate(Box, keys=[(args["id"], )])],
+            response_cache=None,
+        )
+
+        execute("{ box { value } }")
+        execute("mutation { updateBox(id: 1, value: 1) { value } }")
+
+        assert_that(execute("{ box { value } }"), is_successful_result(data={
+            "box": {"value": 1},
+        }))
+
+    def test_mutation_does_not_invalidate_cached_entities_with_other_keys(self):
+        execute = self._create_executor(
+            invalidates=lambda Box, args: [invalidate(Box, keys=[(2, )])],
+            response_cache=None,
+        )
+
+        execute("{ box { value } }")
+        execute("mutation { updateBox(id: 1, value: 1) { value } }")
+
+        assert_that(execute("{ box { value } }"), is_successful_result(data={
+            "box": {"value": 0},
+        }))
+
+    def _create_executor(self, invalidates, response_cache=False):
+        if response_cache is False:
+            response_cache = InMemoryCache(max_size=10)
+
+        BoxRecord = attr.make_class("Box", ["id", "value"])
+
+        box = BoxRecord(1, 0)
+
+        class BoxFields(object):
+            id = field(type=GraphQLInt)
+            value = field(type=GraphQLInt)
+
+        class Box(StaticDataObjectType, BoxFields):
+            __records__ = [box]
+            __entity_cache__ = InMemoryCache(max_size=10)
+            __entity_key__ = ("id", )
+
+            @classmethod
+            def __select_by_keys__(cls, fields, keys, context):
+                return [record for record in cls.__records__ if (record.id, ) in keys]
+
+        class BoxMutation(Mutation, ObjectType, BoxFields):
+            __args__ = {
+                "id": GraphQLInt,
+                "value": GraphQLNonNull(GraphQLInt),
+            }
+
+            @classmethod
+            def __mutate__(cls, selections, query, context):
+                box.value = query["value"]
+                return Box.__fetch_immediates__(selections, [box], context)
+
+            @classmethod
+            def __invalidates__(cls, args, context):
+                return invalidates(Box, args)
+
+        class MutationRoot(RootType):
+            update_box = mutation_field(lambda: BoxMutation)
+
+        class Root(RootType):
+            box = single(lambda: select(Box))
+
+        return executor(Root, mutation=MutationRoot, response_cache=response_cache)
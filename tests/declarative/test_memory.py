@@ -0,0 +1,87 @@
+import attr
+from hamcrest import assert_that, equal_to
+
+from graphjoiner.declarative import executor, field, Int, many, RootType, select, single, String
+from graphjoiner.declarative.memory import InMemoryObjectType
+from ..matchers import is_successful_result
+
+
+AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+
+
+class Author(InMemoryObjectType):
+    __records__ = [AuthorRecord(1, "PG Wodehouse"), AuthorRecord(2, "Joseph Heller")]
+
+    id = field(type=Int)
+    name = field(type=String)
+    books = many(lambda: select(Book, join_fields={Author.id: Book.author_id}))
+
+
+class Book(InMemoryObjectType):
+    __records__ = [
+        {"title": "Leave It to Psmith", "author_id": 1},
+        {"title": "Right Ho, Jeeves", "author_id": 1},
+        {"title": "Catch-22", "author_id": 2},
+    ]
+
+    title = field(type=String)
+    author_id = field(type=Int)
+    author = single(lambda: select(Author, join_fields={Book.author_id: Author.id}))
+
+
+class Root(RootType):
+    books = many(lambda: select(Book))
+    authors = many(lambda: select(Author))
+
+    @authors.arg("id", Int)
+    def authors_id(records, author_id):
+        return [record for record in records if record.id == author_id]
+
+
+def test_values_are_read_from_objects_and_dicts():
+    result = executor(Root)("{ books { title author { name } } }")
+
+    assert_that(result, is_successful_result(data={
+        "books": [
+            {"title": "Leave It to Psmith", "author": {"name": "PG Wodehouse"}},
+            {"title": "Right Ho, Jeeves", "author": {"name": "PG Wodehouse"}},
+            {"title": "Catch-22", "author": {"name": "Joseph Heller"}},
+        ],
+    }))
+
+
+def test_relationships_are_fetched_using_index_on_join_fields():
+    result = executor(Root)("{ authors(id: 1) { books { title } } }")
+
+    assert_that(result, is_successful_result(data={
+        "authors": [
+            {"books": [{"title": "Leave It to Psmith"}, {"title": "Right Ho, Jeeves"}]},
+        ],
+    }))
+
+
+def test_indexes_are_rebuilt_after_reindexing():
+    class Tag(InMemoryObjectType):
+        __records__ = [{"name": "comedy", "book_title": "Catch-22"}]
+
+        name = field(type=String)
+        book_title = field(type=String)
+
+    class TaggedBook(InMemoryObjectType):
+        __records__ = [{"title": "Catch-22"}]
+
+        title = field(type=String)
+        tags = many(lambda: select(Tag, join_fields={TaggedBook.title: Tag.book_title}))
+
+    class TagRoot(RootType):
+        books = many(lambda: select(TaggedBook))
+
+    execute = executor(TagRoot)
+    execute("{ books { tags { name } } }")
+    Tag.__records__ = Tag.__records__ + [{"name": "war", "book_title": "Catch-22"}]
+    Tag.__reindex__()
+    result = execute("{ books { tags { name } } }")
+
+    assert_that(result.data, equal_to({
+        "books": [{"tags": [{"name": "comedy"}, {"name": "war"}]}],
+    }))
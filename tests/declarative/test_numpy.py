@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+
+from hamcrest import assert_that, equal_to, instance_of
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from graphjoiner.declarative import executor, field, Int, many, RootType, select, single, String
+from graphjoiner.declarative.numpy import load_column_indexes, load_columns, NumpyObjectType, save_columns
+from ..matchers import is_successful_result
+
+
+class Author(NumpyObjectType):
+    __columns__ = {
+        "id": numpy.array([2, 1]),
+        "name": numpy.array(["Joseph Heller", "PG Wodehouse"]),
+    }
+
+    id = field(type=Int)
+    name = field(type=String)
+    books = many(lambda: select(Book, join_fields={Author.id: Book.author_id}))
+
+
+class Book(NumpyObjectType):
+    __columns__ = {
+        "title": numpy.array(["Leave It to Psmith", "Catch-22", "Right Ho, Jeeves"]),
+        "year": numpy.array([1923, 1961, 1934]),
+        "author_id": numpy.array([1, 2, 1]),
+    }
+
+    title = field(type=String)
+    year = field(type=Int)
+    author_id = field(type=Int)
+    author = single(lambda: select(Author, join_fields={Book.author_id: Author.id}))
+
+
+class Root(RootType):
+    books = many(lambda: select(Book))
+    authors = many(lambda: select(Author))
+
+    @books.arg("publishedBefore", Int)
+    def books_published_before(indices, year):
+        return indices[Book.__columns__["year"][indices] < year]
+
+
+def test_values_are_read_from_columns():
+    result = executor(Root)("{ books { title year author { name } } }")
+
+    assert_that(result, is_successful_result(data={
+        "books": [
+            {"title": "Leave It to Psmith", "year": 1923, "author": {"name": "PG Wodehouse"}},
+            {"title": "Catch-22", "year": 1961, "author": {"name": "Joseph Heller"}},
+            {"title": "Right Ho, Jeeves", "year": 1934, "author": {"name": "PG Wodehouse"}},
+        ],
+    }))
+
+
+def test_values_for_each_key_are_found_in_sorted_join_column():
+    result = executor(Root)("{ authors { name books { title } } }")
+
+    assert_that(result, is_successful_result(data={
+        "authors": [
+            {"name": "Joseph Heller", "books": [{"title": "Catch-22"}]},
+            {"name": "PG Wodehouse", "books": [{"title": "Leave It to Psmith"}, {"title": "Right Ho, Jeeves"}]},
+        ],
+    }))
+
+
+def test_args_can_filter_rows_using_columns():
+    result = executor(Root)("{ books(publishedBefore: 1950) { title } }")
+
+    assert_that(result, is_successful_result(data={
+        "books": [{"title": "Leave It to Psmith"}, {"title": "Right Ho, Jeeves"}],
+    }))
+
+
+def test_columns_and_indexes_can_be_memory_mapped_from_saved_files(tmpdir):
+    save_columns(str(tmpdir), Book.__columns__, indexes=["author_id"])
+
+    class MappedBook(NumpyObjectType):
+        __columns__ = load_columns(str(tmpdir))
+        __column_indexes__ = load_column_indexes(str(tmpdir))
+
+        title = field(type=String)
+        author_id = field(type=Int)
+
+    class MappedAuthor(NumpyObjectType):
+        __columns__ = Author.__columns__
+
+        name = field(type=String)
+        id = field(type=Int)
+        books = many(lambda: select(MappedBook, join_fields={MappedAuthor.id: MappedBook.author_id}))
+
+    class MappedRoot(RootType):
+        authors = many(lambda: select(MappedAuthor))
+
+    result = executor(MappedRoot)("{ authors { name books { title } } }")
+
+    assert_that(result, is_successful_result(data={
+        "authors": [
+            {"name": "Joseph Heller", "books": [{"title": "Catch-22"}]},
+            {"name": "PG Wodehouse", "books": [{"title": "Leave It to Psmith"}, {"title": "Right Ho, Jeeves"}]},
+        ],
+    }))
+    assert_that(sorted(MappedBook.__columns__.keys()), equal_to(["author_id", "title", "year"]))
+    assert_that(MappedBook.__columns__["title"], instance_of(numpy.memmap))
+    assert_that(MappedBook.__column_indexes__["author_id"][1], instance_of(numpy.memmap))
@@ -1,21 +1,35 @@
+import collections
+import datetime
 import os
+import threading
 
 import graphql
-from hamcrest import all_of, assert_that, contains_inanyorder, equal_to, has_properties, has_string, instance_of, starts_with
+from hamcrest import all_of, assert_that, contains_inanyorder, equal_to, has_length, has_properties, has_string, instance_of, is_not, starts_with
 import pytest
-from sqlalchemy import create_engine, Column, ForeignKey, Integer, literal, String, Unicode
+from sqlalchemy import create_engine, Column, DateTime, ForeignKey, Integer, LargeBinary, literal, String, Unicode
 import sqlalchemy.event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import relationship, Session
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query, relationship, Session, sessionmaker
 import sqlalchemy.pool
 
-from graphjoiner.declarative import executor, field, many, RootType, select
+from graphjoiner.caches import InMemoryCache
+from graphjoiner.declarative import executor, field, invalidate, many, Mutation, mutation_field, ObjectType, RootType, select, single
 from graphjoiner.declarative.sqlalchemy import (
+    ReplicaRouter,
+    SessionProvider,
     SqlAlchemyObjectType,
     column_field,
+    keyset_connection,
+    sql_count,
+    sql_exists,
     sql_join,
+    sql_max,
+    sql_min,
+    sql_sum,
     _find_join_candidates,
+    _PreparedStatement,
     _sql_column_to_graphql_type,
 )
 from ..matchers import is_invalid_result, is_successful_result
@@ -351,6 +365,957 @@ def test_column_field_can_be_marked_as_internal(engine):
     )
 
 
+def test_entity_cache_fetches_uncached_entities_by_key(engine):
+    Base = declarative_base()
+
+    class AuthorRecord(Base):
+        __tablename__ = "author"
+
+        c_id = Column(Integer, primary_key=True)
+        c_name = Column(Unicode, nullable=False)
+
+    class Author(SqlAlchemyObjectType):
+        __model__ = AuthorRecord
+        __entity_cache__ = InMemoryCache(max_size=10)
+        __entity_key__ = ("id", )
+
+        id = column_field(AuthorRecord.c_id)
+        name = column_field(AuthorRecord.c_name)
+
+    class Root(RootType):
+        authors = many(lambda: select(Author))
+
+    Base.metadata.create_all(engine)
+
+    session = Session(engine)
+    session.add(AuthorRecord(c_id=1, c_name="PG Wodehouse"))
+    session.commit()
+
+    execute = executor(Root)
+    execute("{ authors { name } }", context=QueryContext(session=session))
+
+    session.query(AuthorRecord).update({"c_name": "Pelham Grenville Wodehouse"})
+    session.add(AuthorRecord(c_id=2, c_name="Joseph Heller"))
+    session.commit()
+
+    result = execute("{ authors { name } }", context=QueryContext(session=session))
+    assert_that(result, is_successful_result(data={
+        "authors": [
+            {"name": "PG Wodehouse"},
+            {"name": "Joseph Heller"},
+        ],
+    }))
+
+
+def test_sql_joins_to_same_type_from_different_parents_are_fetched_once(engine):
+    Base = declarative_base()
+
+    class AuthorRecord(Base):
+        __tablename__ = "author"
+
+        c_id = Column(Integer, primary_key=True)
+        c_name = Column(Unicode, nullable=False)
+
+    class BookRecord(Base):
+        __tablename__ = "book"
+
+        c_id = Column(Integer, primary_key=True)
+        c_title = Column(Unicode, nullable=False)
+        c_author_id = Column(Integer, ForeignKey(AuthorRecord.c_id))
+        author = relationship(AuthorRecord)
+
+    class ReviewRecord(Base):
+        __tablename__ = "review"
+
+        c_id = Column(Integer, primary_key=True)
+        c_body = Column(Unicode, nullable=False)
+        c_author_id = Column(Integer, ForeignKey(AuthorRecord.c_id))
+        author = relationship(AuthorRecord)
+
+    class Author(SqlAlchemyObjectType):
+        __model__ = AuthorRecord
+
+        id = column_field(AuthorRecord.c_id)
+        name = column_field(AuthorRecord.c_name)
+
+    class Book(SqlAlchemyObjectType):
+        __model__ = BookRecord
+
+        title = column_field(BookRecord.c_title)
+        author_id = column_field(BookRecord.c_author_id)
+        author = single(lambda: sql_join(Author))
+
+    class Review(SqlAlchemyObjectType):
+        __model__ = ReviewRecord
+
+        body = column_field(ReviewRecord.c_body)
+        author_id = column_field(ReviewRecord.c_author_id)
+        author = single(lambda: sql_join(Author))
+
+    class Root(RootType):
+        books = many(lambda: select(Book))
+        reviews = many(lambda: select(Review))
+
+    Base.metadata.create_all(engine)
+
+    session = Session(engine)
+    wodehouse = AuthorRecord(c_name="PG Wodehouse")
+    heller = AuthorRecord(c_name="Joseph Heller")
+    session.add(BookRecord(c_title="Leave It to Psmith", author=wodehouse))
+    session.add(ReviewRecord(c_body="Funny", author=heller))
+    session.commit()
+
+    statements = []
+
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    try:
+        result = executor(Root)("""{
+            books { title author { name } }
+            reviews { body author { name } }
+        }""", context=QueryContext(session=session))
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", record_statement)
+
+    assert_that(result, is_successful_result(data={
+        "books": [{"title": "Leave It to Psmith", "author": {"name": "PG Wodehouse"}}],
+        "reviews": [{"body": "Funny", "author": {"name": "Joseph Heller"}}],
+    }))
+    assert_that(
+        len([statement for statement in statements if "FROM author" in statement]),
+        equal_to(1),
+    )
+
+
+def test_paginated_sql_joins_limit_values_per_parent(engine):
+    Base = declarative_base()
+
+    class BookRecord(Base):
+        __tablename__ = "book"
+
+        c_id = Column(Integer, primary_key=True)
+        c_title = Column(Unicode, nullable=False)
+
+    class ReviewRecord(Base):
+        __tablename__ = "review"
+
+        c_id = Column(Integer, primary_key=True)
+        c_body = Column(Unicode, nullable=False)
+        c_book_id = Column(Integer, ForeignKey(BookRecord.c_id))
+
+    class Book(SqlAlchemyObjectType):
+        __model__ = BookRecord
+
+        id = column_field(BookRecord.c_id)
+        title = column_field(BookRecord.c_title)
+        reviews = many(lambda: sql_join(
+            Review,
+            order_by=[ReviewRecord.c_id.desc()],
+            paginate=True,
+        ))
+
+    class Review(SqlAlchemyObjectType):
+        __model__ = ReviewRecord
+
+        body = column_field(ReviewRecord.c_body)
+        book_id = column_field(ReviewRecord.c_book_id)
+
+    class Root(RootType):
+        books = many(lambda: select(Book))
+
+    Base.metadata.create_all(engine)
+
+    session = Session(engine)
+    session.add(BookRecord(c_id=1, c_title="Leave It to Psmith"))
+    session.add(BookRecord(c_id=2, c_title="Catch-22"))
+    session.add_all([
+        ReviewRecord(c_id=1, c_body="Funny", c_book_id=1),
+        ReviewRecord(c_id=2, c_body="Funnier", c_book_id=1),
+        ReviewRecord(c_id=3, c_body="Funniest", c_book_id=1),
+        ReviewRecord(c_id=4, c_body="Absurd", c_book_id=2),
+    ])
+    session.commit()
+
+    execute = executor(Root)
+
+    result = execute("""{
+        books {
+            title
+            latest: reviews(first: 2) { body }
+            older: reviews(after: 1, first: 1) { body }
+            all: reviews { body }
+        }
+    }""", context=QueryContext(session=session))
+    assert_that(result, is_successful_result(data={
+        "books": [
+            {
+                "title": "Leave It to Psmith",
+                "latest": [{"body": "Funniest"}, {"body": "Funnier"}],
+                "older": [{"body": "Funnier"}],
+                "all": [{"body": "Funniest"}, {"body": "Funnier"}, {"body": "Funny"}],
+            },
+            {
+                "title": "Catch-22",
+                "latest": [{"body": "Absurd"}],
+                "older": [],
+                "all": [{"body": "Absurd"}],
+            },
+        ],
+    }))
+
+
+def test_aggregates_are_computed_per_parent_in_sql(engine):
+    Base = declarative_base()
+
+    class AuthorRecord(Base):
+        __tablename__ = "author"
+
+        c_id = Column(Integer, primary_key=True)
+        c_name = Column(Unicode, nullable=False)
+
+    class BookRecord(Base):
+        __tablename__ = "book"
+
+        c_id = Column(Integer, primary_key=True)
+        c_pages = Column(Integer, nullable=False)
+        c_author_id = Column(Integer, ForeignKey(AuthorRecord.c_id))
+
+    class Author(SqlAlchemyObjectType):
+        __model__ = AuthorRecord
+
+        id = column_field(AuthorRecord.c_id)
+        name = column_field(AuthorRecord.c_name)
+        book_count = sql_count(lambda: Book)
+        has_books = sql_exists(lambda: Book)
+        total_pages = sql_sum(lambda: Book, BookRecord.c_pages)
+        shortest_book_pages = sql_min(lambda: Book, BookRecord.c_pages)
+        longest_book_pages = sql_max(lambda: Book, BookRecord.c_pages)
+
+    class Book(SqlAlchemyObjectType):
+        __model__ = BookRecord
+
+        id = column_field(BookRecord.c_id)
+        author_id = column_field(BookRecord.c_author_id)
+
+    class Root(RootType):
+        authors = many(lambda: select(Author))
+
+    Base.metadata.create_all(engine)
+
+    session = Session(engine)
+    session.add_all([
+        AuthorRecord(c_id=1, c_name="PG Wodehouse"),
+        AuthorRecord(c_id=2, c_name="Joseph Heller"),
+        BookRecord(c_id=1, c_pages=200, c_author_id=1),
+        BookRecord(c_id=2, c_pages=250, c_author_id=1),
+    ])
+    session.commit()
+
+    statements = []
+
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    try:
+        result = executor(Root)("""{
+            authors {
+                name
+                bookCount
+                hasBooks
+                totalPages
+                shortestBookPages
+                longestBookPages
+            }
+        }""", context=QueryContext(session=session))
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", record_statement)
+
+    assert_that(result, is_successful_result(data={
+        "authors": [
+            {
+                "name": "PG Wodehouse",
+                "bookCount": 2,
+                "hasBooks": True,
+                "totalPages": 450,
+                "shortestBookPages": 200,
+                "longestBookPages": 250,
+            },
+            {
+                "name": "Joseph Heller",
+                "bookCount": 0,
+                "hasBooks": False,
+                "totalPages": None,
+                "shortestBookPages": None,
+                "longestBookPages": None,
+            },
+        ],
+    }))
+    assert_that(
+        [statement for statement in statements if "GROUP BY" in statement],
+        has_length(5),
+    )
+
+
+def test_invalidating_target_of_aggregate_invalidates_cached_responses_with_aggregate(engine):
+    Base = declarative_base()
+
+    class AuthorRecord(Base):
+        __tablename__ = "author"
+
+        c_id = Column(Integer, primary_key=True)
+
+    class BookRecord(Base):
+        __tablename__ = "book"
+
+        c_id = Column(Integer, primary_key=True)
+        c_author_id = Column(Integer, ForeignKey(AuthorRecord.c_id))
+
+    class Author(SqlAlchemyObjectType):
+        __model__ = AuthorRecord
+
+        id = column_field(AuthorRecord.c_id)
+        book_count = sql_count(lambda: Book)
+
+    class Book(SqlAlchemyObjectType):
+        __model__ = BookRecord
+
+        id = column_field(BookRecord.c_id)
+        author_id = column_field(BookRecord.c_author_id)
+
+    class AddBook(Mutation, ObjectType):
+        __args__ = {}
+
+        book_id = field(type=graphql.GraphQLInt)
+
+        @classmethod
+        def __mutate__(cls, selections, query, context):
+            context.session.add(BookRecord(c_id=2, c_author_id=1))
+            context.session.commit()
+            return [tuple(2 for selection in selections)]
+
+        @classmethod
+        def __invalidates__(cls, args, context):
+            return [invalidate(Book)]
+
+    class MutationRoot(RootType):
+        add_book = mutation_field(lambda: AddBook)
+
+    class Root(RootType):
+        authors = many(lambda: select(Author))
+
+    Base.metadata.create_all(engine)
+
+    session = Session(engine)
+    session.add_all([
+        AuthorRecord(c_id=1),
+        BookRecord(c_id=1, c_author_id=1),
+    ])
+    session.commit()
+
+    execute = executor(Root, mutation=MutationRoot, response_cache=InMemoryCache(max_size=10))
+    context = QueryContext(session=session)
+    execute("{ authors { bookCount } }", context=context)
+    execute("mutation { addBook { bookId } }", context=context)
+    result = execute("{ authors { bookCount } }", context=context)
+
+    assert_that(result, is_successful_result(data={
+        "authors": [{"bookCount": 2}],
+    }))
+
+
+def test_rows_are_returned_as_iterator_so_fetching_can_stop_at_row_limit(engine):
+    Base = declarative_base()
+
+    class AuthorRecord(Base):
+        __tablename__ = "author"
+
+        c_id = Column(Integer, primary_key=True)
+
+    class Author(SqlAlchemyObjectType):
+        __model__ = AuthorRecord
+
+        id = column_field(AuthorRecord.c_id)
+
+    Base.metadata.create_all(engine)
+
+    session = Session(engine)
+    session.add_all([AuthorRecord(c_id=1), AuthorRecord(c_id=2)])
+    session.commit()
+
+    Selection = collections.namedtuple("Selection", ["field"])
+    rows = Author.__fetch_immediates__([Selection(Author.id)], Author.__select_all__(), QueryContext(session=session))
+
+    assert_that(rows, is_not(instance_of(list)))
+    assert_that([tuple(row) for row in rows], contains_inanyorder((1, ), (2, )))
+
+
+class TestKeysetConnection(object):
+    def test_first_selects_first_page_ordered_by_keyset(self, engine):
+        execute = self._create_executor(engine)
+
+        result = execute("""{
+            books(first: 2) {
+                edges { node { title } }
+                pageInfo { hasNextPage hasPreviousPage }
+            }
+        }""")
+
+        assert_that(result, is_successful_result(data={
+            "books": {
+                "edges": [
+                    {"node": {"title": "Catch-22"}},
+                    {"node": {"title": "Leave It to Psmith"}},
+                ],
+                "pageInfo": {"hasNextPage": True, "hasPreviousPage": False},
+            },
+        }))
+
+    def test_after_selects_values_after_cursor(self, engine):
+        execute = self._create_executor(engine)
+
+        first_page = execute("{ books(first: 2) { pageInfo { endCursor } } }")
+        end_cursor = first_page.data["books"]["pageInfo"]["endCursor"]
+        result = execute("""
+            query ($after: String) {
+                books(first: 2, after: $after) {
+                    edges { node { title } }
+                    pageInfo { hasNextPage }
+                }
+            }
+        """, variables={"after": end_cursor})
+
+        assert_that(result, is_successful_result(data={
+            "books": {
+                "edges": [{"node": {"title": "Right Ho, Jeeves"}}],
+                "pageInfo": {"hasNextPage": False},
+            },
+        }))
+
+    def test_cursors_of_edges_can_be_used_as_after(self, engine):
+        execute = self._create_executor(engine)
+
+        edges = execute("{ books { edges { cursor } } }").data["books"]["edges"]
+        result = execute("""
+            query ($after: String) {
+                books(after: $after) { edges { node { title } } }
+            }
+        """, variables={"after": edges[0]["cursor"]})
+
+        assert_that(result, is_successful_result(data={
+            "books": {
+                "edges": [
+                    {"node": {"title": "Leave It to Psmith"}},
+                    {"node": {"title": "Right Ho, Jeeves"}},
+                ],
+            },
+        }))
+
+    def test_invalid_cursor_is_rejected(self, engine):
+        execute = self._create_executor(engine)
+
+        result = execute('{ books(after: "nonsense") { edges { cursor } } }')
+
+        assert_that(result, is_invalid_result(errors=contains_inanyorder(
+            has_string("Invalid cursor: nonsense"),
+        )))
+
+    def test_default_page_size_is_used_when_first_is_omitted(self, engine):
+        execute = self._create_executor(engine, default_page_size=2)
+
+        result = execute("{ books { edges { node { title } } pageInfo { hasNextPage } } }")
+
+        assert_that(result, is_successful_result(data={
+            "books": {
+                "edges": [
+                    {"node": {"title": "Catch-22"}},
+                    {"node": {"title": "Leave It to Psmith"}},
+                ],
+                "pageInfo": {"hasNextPage": True},
+            },
+        }))
+
+    def test_first_greater_than_max_page_size_is_rejected(self, engine):
+        execute = self._create_executor(engine, max_page_size=2)
+
+        result = execute("{ books(first: 3) { edges { cursor } } }")
+
+        assert_that(result, is_invalid_result(errors=contains_inanyorder(
+            has_string("first must be at most 2"),
+        )))
+
+    def test_negative_first_is_rejected(self, engine):
+        execute = self._create_executor(engine)
+
+        result = execute("{ books(first: -1) { edges { cursor } } }")
+
+        assert_that(result, is_invalid_result(errors=contains_inanyorder(
+            has_string("first must not be negative"),
+        )))
+
+    @pytest.mark.parametrize("order_by", [
+        lambda BookRecord: [BookRecord.c_title.desc(), BookRecord.c_id.desc()],
+        lambda BookRecord: [BookRecord.c_title.desc(), BookRecord.c_id.asc()],
+    ])
+    def test_pages_can_be_ordered_by_descending_columns(self, engine, order_by):
+        execute = self._create_executor(engine, order_by=order_by)
+
+        first_page = execute("{ books(first: 1) { pageInfo { endCursor } } }")
+        end_cursor = first_page.data["books"]["pageInfo"]["endCursor"]
+        result = execute("""
+            query ($after: String) {
+                books(first: 2, after: $after) { edges { node { title } } }
+            }
+        """, variables={"after": end_cursor})
+
+        assert_that(result, is_successful_result(data={
+            "books": {
+                "edges": [
+                    {"node": {"title": "Leave It to Psmith"}},
+                    {"node": {"title": "Catch-22"}},
+                ],
+            },
+        }))
+
+    def test_page_info_does_not_clash_with_other_types_named_page_info(self, engine):
+        class PageInfo(ObjectType):
+            __select_all__ = staticmethod(lambda: None)
+            __fetch_immediates__ = staticmethod(lambda selections, query, context: [("1", )])
+
+            number = field(type=graphql.GraphQLString)
+
+        execute = self._create_executor(engine, extra_root_fields={
+            "page": single(lambda: select(PageInfo)),
+        })
+
+        result = execute("{ page { number } books(first: 1) { pageInfo { hasNextPage } } }")
+
+        assert_that(result, is_successful_result(data={
+            "page": {"number": "1"},
+            "books": {"pageInfo": {"hasNextPage": True}},
+        }))
+
+    def test_cursors_can_encode_datetime_columns(self, engine):
+        execute = self._create_executor(
+            engine,
+            order_by=lambda BookRecord: [BookRecord.c_published.desc(), BookRecord.c_id],
+        )
+
+        first_page = execute("{ books(first: 1) { edges { node { title } } pageInfo { endCursor } } }")
+        end_cursor = first_page.data["books"]["pageInfo"]["endCursor"]
+        result = execute("""
+            query ($after: String) {
+                books(first: 2, after: $after) { edges { node { title } } }
+            }
+        """, variables={"after": end_cursor})
+
+        assert_that(first_page.data["books"]["edges"], equal_to([{"node": {"title": "Catch-22"}}]))
+        assert_that(result, is_successful_result(data={
+            "books": {
+                "edges": [
+                    {"node": {"title": "Right Ho, Jeeves"}},
+                    {"node": {"title": "Leave It to Psmith"}},
+                ],
+            },
+        }))
+
+    def test_order_by_columns_of_types_that_cannot_be_encoded_are_rejected(self, engine):
+        with pytest.raises(ValueError) as error:
+            self._create_executor(engine, order_by=lambda BookRecord: [BookRecord.c_cover, BookRecord.c_id])
+
+        assert_that(str(error.value), starts_with("Unsupported type of order_by column for keyset connection"))
+
+    def _create_executor(self, engine, order_by=None, extra_root_fields=None, **connection_kwargs):
+        if order_by is None:
+            order_by = lambda BookRecord: [BookRecord.c_title, BookRecord.c_id]
+        if extra_root_fields is None:
+            extra_root_fields = {}
+
+        Base = declarative_base()
+
+        class BookRecord(Base):
+            __tablename__ = "book"
+
+            c_id = Column(Integer, primary_key=True)
+            c_title = Column(Unicode, nullable=False)
+            c_published = Column(DateTime, nullable=False)
+            c_cover = Column(LargeBinary)
+
+        class Book(SqlAlchemyObjectType):
+            __model__ = BookRecord
+
+            id = column_field(BookRecord.c_id)
+            title = column_field(BookRecord.c_title)
+
+        root_fields = dict(
+            books=keyset_connection(lambda: Book, order_by=order_by(BookRecord), **connection_kwargs),
+        )
+        root_fields.update(extra_root_fields)
+        Root = type(RootType)("Root", (RootType, ), root_fields)
+
+        Base.metadata.create_all(engine)
+
+        session = Session(engine)
+        session.add_all([
+            BookRecord(c_id=1, c_title="Leave It to Psmith", c_published=datetime.datetime(1923, 6, 1)),
+            BookRecord(c_id=2, c_title="Right Ho, Jeeves", c_published=datetime.datetime(1934, 10, 1)),
+            BookRecord(c_id=3, c_title="Catch-22", c_published=datetime.datetime(1961, 11, 10, 12, 30, 15, 500)),
+        ])
+        session.commit()
+
+        execute = executor(Root)
+        return lambda query, **kwargs: execute(query, context=QueryContext(session=session), **kwargs)
+
+
+class TestSessionProvider(object):
+    def test_each_thread_is_given_its_own_session(self, tmpdir):
+        engine = create_engine("sqlite:///" + str(tmpdir.join("db.sqlite")))
+        provider = SessionProvider(lambda: Session(engine))
+        thread_sessions = []
+
+        thread = threading.Thread(target=lambda: thread_sessions.append(provider.session()))
+        thread.start()
+        thread.join()
+
+        assert_that(provider.session(), instance_of(Session))
+        assert_that(provider.session() is provider.session(), equal_to(True))
+        assert_that(provider.session() is thread_sessions[0], equal_to(False))
+
+    def test_sessions_are_closed_when_provider_is_closed(self, tmpdir):
+        engine = create_engine("sqlite:///" + str(tmpdir.join("db.sqlite")))
+        closed = []
+
+        class RecordingSession(Session):
+            def close(self):
+                closed.append(self)
+                super(RecordingSession, self).close()
+
+        with SessionProvider(lambda: RecordingSession(engine)) as provider:
+            session = provider.session()
+
+        assert_that(closed, equal_to([session]))
+        assert_that(provider.session() is session, equal_to(False))
+
+    def test_sessions_use_isolation_level(self, tmpdir):
+        engine = create_engine("sqlite:///" + str(tmpdir.join("db.sqlite")))
+
+        with SessionProvider(lambda: Session(engine), isolation_level="READ UNCOMMITTED") as provider:
+            isolation_level = provider.session().connection().get_isolation_level()
+
+        assert_that(isolation_level, equal_to("READ UNCOMMITTED"))
+
+    def test_sessions_use_read_only_transactions(self, postgresql_engine):
+        with SessionProvider(lambda: Session(postgresql_engine), read_only=True) as provider:
+            read_only = provider.session().execute("SHOW transaction_read_only").scalar()
+
+        assert_that(read_only, equal_to("on"))
+
+    def test_sessions_share_snapshot_of_first_session(self, pooled_postgresql_engine):
+        engine = pooled_postgresql_engine
+        provider = SessionProvider(
+            lambda: Session(engine),
+            isolation_level="REPEATABLE READ",
+            read_only=True,
+            share_snapshot=True,
+        )
+        snapshots = []
+
+        def read_snapshot():
+            snapshots.append(provider.session().execute("SELECT txid_current_snapshot()::text").scalar())
+
+        with provider:
+            read_snapshot()
+            # Committing a transaction after the first session's snapshot
+            # was taken means that a new snapshot would differ from it.
+            with engine.begin() as connection:
+                connection.execute("SELECT txid_current()")
+            thread = threading.Thread(target=read_snapshot)
+            thread.start()
+            thread.join()
+
+        assert_that(snapshots, has_length(2))
+        assert_that(snapshots[1], equal_to(snapshots[0]))
+
+    def test_concurrent_fetches_use_sessions_from_provider(self, tmpdir):
+        engine = create_engine(
+            "sqlite:///" + str(tmpdir.join("db.sqlite")),
+            connect_args={"check_same_thread": False},
+        )
+        Base = declarative_base()
+
+        class AuthorRecord(Base):
+            __tablename__ = "author"
+
+            c_id = Column(Integer, primary_key=True)
+            c_name = Column(Unicode, nullable=False)
+
+        class BookRecord(Base):
+            __tablename__ = "book"
+
+            c_id = Column(Integer, primary_key=True)
+            c_title = Column(Unicode, nullable=False)
+            c_author_id = Column(Integer, ForeignKey(AuthorRecord.c_id))
+
+        class Author(SqlAlchemyObjectType):
+            __model__ = AuthorRecord
+
+            id = column_field(AuthorRecord.c_id)
+            name = column_field(AuthorRecord.c_name)
+
+        class Book(SqlAlchemyObjectType):
+            __model__ = BookRecord
+
+            id = column_field(BookRecord.c_id)
+            title = column_field(BookRecord.c_title)
+            author_id = column_field(BookRecord.c_author_id)
+            author = single(lambda: sql_join(Author))
+
+        class Root(RootType):
+            authors = many(lambda: select(Author))
+            books = many(lambda: select(Book))
+
+        Base.metadata.create_all(engine)
+
+        session = Session(engine)
+        session.add_all([
+            AuthorRecord(c_id=1, c_name="PG Wodehouse"),
+            BookRecord(c_id=1, c_title="Leave It to Psmith", c_author_id=1),
+        ])
+        session.commit()
+        session.close()
+
+        execute = executor(Root, fetch_concurrency=2)
+        with SessionProvider(lambda: Session(engine)) as provider:
+            result = execute(
+                "{ authors { name } books { title author { name } } }",
+                context=QueryContext(session=provider),
+            )
+
+        assert_that(result, is_successful_result(data={
+            "authors": [{"name": "PG Wodehouse"}],
+            "books": [{"title": "Leave It to Psmith", "author": {"name": "PG Wodehouse"}}],
+        }))
+
+
+class TestReplicaRouter(object):
+    def test_reads_use_replica(self, tmpdir):
+        execute, router = self._create_executor(tmpdir)
+
+        with router.sessions() as sessions:
+            result = execute("{ authors { name } }", context=QueryContext(session=sessions))
+
+        assert_that(result, is_successful_result(data={"authors": [{"name": "replica-1"}]}))
+
+    def test_replica_is_chosen_for_each_request(self, tmpdir):
+        execute, router = self._create_executor(tmpdir, choose_replica=lambda replicas: replicas[-1])
+
+        with router.sessions() as sessions:
+            result = execute("{ authors { name } }", context=QueryContext(session=sessions))
+
+        assert_that(result, is_successful_result(data={"authors": [{"name": "replica-2"}]}))
+
+    def test_reads_of_overridden_types_use_override(self, tmpdir):
+        execute, router = self._create_executor(tmpdir, override_books=True)
+
+        with router.sessions() as sessions:
+            result = execute("{ authors { name } books { title } }", context=QueryContext(session=sessions))
+
+        assert_that(result, is_successful_result(data={
+            "authors": [{"name": "replica-1"}],
+            "books": [{"title": "primary"}],
+        }))
+
+    @pytest.mark.parametrize("get_mutation_session", [
+        lambda Author, context: context.session.primary(),
+        lambda Author, context: Author.__get_session__(context),
+    ])
+    def test_mutations_write_to_primary_and_later_reads_use_primary(self, tmpdir, get_mutation_session):
+        execute, router = self._create_executor(tmpdir, get_mutation_session=get_mutation_session)
+
+        with router.sessions() as sessions:
+            result = execute(
+                'mutation { renameAuthor(name: "renamed") { author { name } } }',
+                context=QueryContext(session=sessions),
+            )
+        with router.sessions() as sessions:
+            replica_result = execute("{ authors { name } }", context=QueryContext(session=sessions))
+
+        assert_that(result, is_successful_result(data={
+            "renameAuthor": {"author": {"name": "renamed"}},
+        }))
+        assert_that(replica_result, is_successful_result(data={"authors": [{"name": "replica-1"}]}))
+
+    def _create_executor(self, tmpdir, override_books=False, choose_replica=lambda replicas: replicas[0], get_mutation_session=None):
+        Base = declarative_base()
+
+        class AuthorRecord(Base):
+            __tablename__ = "author"
+
+            c_id = Column(Integer, primary_key=True)
+            c_name = Column(Unicode, nullable=False)
+
+        class BookRecord(Base):
+            __tablename__ = "book"
+
+            c_id = Column(Integer, primary_key=True)
+            c_title = Column(Unicode, nullable=False)
+
+        def create_database(name):
+            engine = create_engine("sqlite:///" + str(tmpdir.join(name + ".sqlite")))
+            Base.metadata.create_all(engine)
+            session = Session(engine)
+            session.add_all([AuthorRecord(c_id=1, c_name=name), BookRecord(c_id=1, c_title=name)])
+            session.commit()
+            session.close()
+            return sessionmaker(bind=engine)
+
+        primary = create_database("primary")
+        replicas = [create_database("replica-1"), create_database("replica-2")]
+
+        class Author(SqlAlchemyObjectType):
+            __model__ = AuthorRecord
+
+            id = column_field(AuthorRecord.c_id)
+            name = column_field(AuthorRecord.c_name)
+
+        class Book(SqlAlchemyObjectType):
+            __model__ = BookRecord
+
+            title = column_field(BookRecord.c_title)
+
+        class RenameAuthor(Mutation, ObjectType):
+            __args__ = {"name": graphql.GraphQLNonNull(graphql.GraphQLString)}
+
+            author_id = field(type=graphql.GraphQLInt, internal=True)
+            author = single(lambda: select(Author, join_fields={RenameAuthor.author_id: Author.id}))
+
+            @classmethod
+            def __mutate__(cls, selections, query, context):
+                session = get_mutation_session(Author, context)
+                session.query(AuthorRecord).filter(AuthorRecord.c_id == 1).update({"c_name": query["name"]})
+                session.commit()
+                return [tuple(1 for selection in selections)]
+
+        class MutationRoot(RootType):
+            rename_author = mutation_field(lambda: RenameAuthor)
+
+        class Root(RootType):
+            authors = many(lambda: select(Author))
+            books = many(lambda: select(Book))
+
+        overrides = {Book: primary} if override_books else None
+        router = ReplicaRouter(primary=primary, replicas=replicas, overrides=overrides, choose_replica=choose_replica)
+        return executor(Root, mutation=MutationRoot), router
+
+
+class TestPreparedStatements(object):
+    def test_statements_are_rewritten_to_prepare_and_execute_by_name(self):
+        Base = declarative_base()
+
+        class AuthorRecord(Base):
+            __tablename__ = "author"
+
+            c_id = Column(Integer, primary_key=True)
+            c_name = Column(Unicode, nullable=False)
+
+        query = Query([]).select_from(AuthorRecord) \
+            .filter(AuthorRecord.c_name.like("P%")) \
+            .with_entities(AuthorRecord.c_id, AuthorRecord.c_name) \
+            .limit(2)
+
+        statement = _PreparedStatement(query.statement, postgresql.dialect())
+        execute_clause = statement.execute_clause().compile(dialect=postgresql.dialect())
+
+        assert_that(statement.prepare_sql, equal_to(
+            "PREPARE {} (VARCHAR, INTEGER) AS SELECT author.c_id, author.c_name \n"
+            "FROM author \n"
+            "WHERE author.c_name LIKE $1 \n"
+            " LIMIT $2".format(statement.name)
+        ))
+        assert_that(str(execute_clause), equal_to("EXECUTE {}(%(p0)s, %(p1)s)".format(statement.name)))
+        assert_that(execute_clause.params, equal_to({"p0": "P%", "p1": 2}))
+
+    def test_values_of_in_lists_are_prepared_as_separate_parameters(self):
+        Base = declarative_base()
+
+        class AuthorRecord(Base):
+            __tablename__ = "author"
+
+            c_id = Column(Integer, primary_key=True)
+
+        query = Query([]).select_from(AuthorRecord) \
+            .filter(AuthorRecord.c_id.in_([1, 2])) \
+            .with_entities(AuthorRecord.c_id)
+
+        statement = _PreparedStatement(query.statement, postgresql.dialect())
+        execute_clause = statement.execute_clause().compile(dialect=postgresql.dialect())
+
+        assert_that(statement.prepare_sql, equal_to(
+            "PREPARE {} (INTEGER, INTEGER) AS SELECT author.c_id \n"
+            "FROM author \n"
+            "WHERE author.c_id IN ($1, $2)".format(statement.name)
+        ))
+        assert_that(execute_clause.params, equal_to({"p0": 1, "p1": 2}))
+
+    def test_prepared_statements_are_executed_on_postgresql(self, postgresql_engine):
+        execute, session = self._create_executor(postgresql_engine)
+
+        first = execute("{ authors { name } }", context=QueryContext(session=session))
+        second = execute("{ authors { name } }", context=QueryContext(session=session))
+        prepared_count = session.execute("SELECT count(*) FROM pg_prepared_statements WHERE name LIKE 'graphjoiner_%'").scalar()
+
+        assert_that(first, is_successful_result(data={"authors": [{"name": "PG Wodehouse"}]}))
+        assert_that(second, is_successful_result(data={"authors": [{"name": "PG Wodehouse"}]}))
+        assert_that(prepared_count, equal_to(1))
+
+    def test_least_recently_used_prepared_statements_are_deallocated(self, postgresql_engine, monkeypatch):
+        monkeypatch.setattr("graphjoiner.declarative.sqlalchemy._max_prepared_statements", 1)
+        execute, session = self._create_executor(postgresql_engine)
+
+        execute("{ authors { name } }", context=QueryContext(session=session))
+        result = execute("{ authors { id name } }", context=QueryContext(session=session))
+        prepared_count = session.execute("SELECT count(*) FROM pg_prepared_statements WHERE name LIKE 'graphjoiner_%'").scalar()
+
+        assert_that(result, is_successful_result(data={"authors": [{"id": 1, "name": "PG Wodehouse"}]}))
+        assert_that(prepared_count, equal_to(1))
+
+    def test_statements_are_executed_directly_on_other_databases(self):
+        execute, session = self._create_executor(create_engine("sqlite:///:memory:"))
+
+        result = execute("{ authors { name } }", context=QueryContext(session=session))
+
+        assert_that(result, is_successful_result(data={"authors": [{"name": "PG Wodehouse"}]}))
+
+    def _create_executor(self, engine):
+        Base = declarative_base()
+
+        class AuthorRecord(Base):
+            __tablename__ = "author"
+
+            c_id = Column(Integer, primary_key=True)
+            c_name = Column(Unicode, nullable=False)
+
+        class Author(SqlAlchemyObjectType):
+            __model__ = AuthorRecord
+            __prepare_statements__ = True
+
+            id = column_field(AuthorRecord.c_id)
+            name = column_field(AuthorRecord.c_name)
+
+        class Root(RootType):
+            authors = many(lambda: select(Author))
+
+        Base.metadata.create_all(engine)
+
+        session = Session(engine)
+        session.add(AuthorRecord(c_name="PG Wodehouse"))
+        session.commit()
+
+        return executor(Root), session
+
+
 def test_type_of_field_is_determined_from_type_of_column():
     Base = declarative_base()
 
@@ -569,6 +1534,41 @@ class TestFindJoinCandidates(object):
             equal_to([(Author.__dict__["id"], Book.__dict__["author_id"])]),
         )
 
+    def test_foreign_keys_in_both_directions_are_found(self):
+        Base = declarative_base()
+
+        class AuthorRecord(Base):
+            __tablename__ = "author"
+
+            c_id = Column(Integer, primary_key=True)
+            c_favourite_book_id = Column(Integer, ForeignKey("book.c_id"))
+
+        class BookRecord(Base):
+            __tablename__ = "book"
+
+            c_id = Column(Integer, primary_key=True)
+            c_author_id = Column(Integer, ForeignKey(AuthorRecord.c_id))
+
+        class Author(SqlAlchemyObjectType):
+            __model__ = AuthorRecord
+
+            id = column_field(AuthorRecord.c_id)
+            favourite_book_id = column_field(AuthorRecord.c_favourite_book_id)
+
+        class Book(SqlAlchemyObjectType):
+            __model__ = BookRecord
+
+            id = column_field(BookRecord.c_id)
+            author_id = column_field(BookRecord.c_author_id)
+
+        assert_that(
+            list(_find_join_candidates(Author, Book)),
+            equal_to([
+                (Author.__dict__["favourite_book_id"], Book.__dict__["id"]),
+                (Author.__dict__["id"], Book.__dict__["author_id"]),
+            ]),
+        )
+
 
 @pytest.fixture(name="engine", params=("postgresql", "sqlite"))
 def fixture_engine(request):
@@ -584,7 +1584,13 @@ def fixture_postgresql_engine():
     return _create_postgresql_engine()
 
 
-def _create_postgresql_engine():
+@pytest.fixture(name="pooled_postgresql_engine")
+def fixture_pooled_postgresql_engine():
+    # Each session needs its own connection to test sharing between them
+    return _create_postgresql_engine(poolclass=sqlalchemy.pool.QueuePool)
+
+
+def _create_postgresql_engine(poolclass=sqlalchemy.pool.StaticPool):
     url = os.environ["TEST_POSTGRESQL_URL"]
     try:
         import psycopg2
@@ -595,7 +1601,7 @@ def _create_postgresql_engine():
         url = sqlalchemy.engine.url.make_url(url)
         url.drivername = "postgresql+psycopg2cffi"
 
-    engine = create_engine(url, poolclass=sqlalchemy.pool.StaticPool)
+    engine = create_engine(url, poolclass=poolclass)
     engine.execute("SET search_path TO pg_temp")
 
     @sqlalchemy.event.listens_for(engine, "engine_connect")
@@ -0,0 +1,314 @@
+import attr
+from hamcrest import assert_that, contains, equal_to, has_string, starts_with
+
+import graphjoiner
+from graphjoiner.caches import InMemoryCache
+from graphjoiner.declarative import executor, field, Int, many, ObjectType, RootType, select, single_or_null, String
+from graphjoiner.schemas import parse_schema
+from .matchers import is_invalid_result, is_successful_result
+
+
+class TestInMemoryCache(object):
+    def test_get_returns_none_for_missing_key(self):
+        cache = InMemoryCache(max_size=2)
+
+        assert_that(cache.get("a"), equal_to(None))
+
+    def test_get_returns_value_that_was_set(self):
+        cache = InMemoryCache(max_size=2)
+        cache.set("a", 1)
+
+        assert_that(cache.get("a"), equal_to(1))
+
+    def test_deleted_values_are_removed(self):
+        cache = InMemoryCache(max_size=2)
+        cache.set("a", 1)
+        cache.delete("a")
+
+        assert_that(cache.get("a"), equal_to(None))
+
+    def test_values_with_deleted_tag_are_removed(self):
+        cache = InMemoryCache(max_size=3)
+        cache.set("a", 1, tags=["x"])
+        cache.set("b", 2, tags=["x", "y"])
+        cache.set("c", 3, tags=["y"])
+        cache.delete_tagged("x")
+
+        assert_that(
+            [cache.get("a"), cache.get("b"), cache.get("c")],
+            equal_to([None, None, 3]),
+        )
+
+    def test_least_recently_used_value_is_evicted_when_cache_is_full(self):
+        cache = InMemoryCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert_that(
+            [cache.get("a"), cache.get("b"), cache.get("c")],
+            equal_to([1, None, 3]),
+        )
+
+    def test_values_expire_after_ttl(self):
+        now = [0]
+        cache = InMemoryCache(max_size=2, ttl=10, clock=lambda: now[0])
+        cache.set("a", 1)
+
+        now[0] = 9
+        assert_that(cache.get("a"), equal_to(1))
+        now[0] = 10
+        assert_that(cache.get("a"), equal_to(None))
+
+
+class TestResponseCache(object):
+    def test_repeated_queries_are_served_from_cache(self):
+        execute, fetches = self._create_executor()
+
+        first = execute("{ authors { name } }")
+        second = execute("""
+            {
+                authors {
+                    name
+                }
+            }
+        """)
+
+        assert_that(first, is_successful_result(data={"authors": [{"name": "PG Wodehouse"}]}))
+        assert_that(second, is_successful_result(data={"authors": [{"name": "PG Wodehouse"}]}))
+        assert_that(len(fetches), equal_to(1))
+
+    def test_queries_with_different_variables_are_cached_separately(self):
+        execute, fetches = self._create_executor()
+        query = """
+            query ($include: Boolean!) {
+                authors { name @include(if: $include) }
+            }
+        """
+
+        execute(query, variables={"include": True})
+        result = execute(query, variables={"include": False})
+
+        assert_that(result, is_successful_result(data={"authors": [{}]}))
+        assert_that(len(fetches), equal_to(2))
+
+    def test_queries_with_different_context_keys_are_cached_separately(self):
+        execute, fetches = self._create_executor(response_cache_key=lambda context: context)
+
+        execute("{ authors { name } }", context="a")
+        execute("{ authors { name } }", context="b")
+        execute("{ authors { name } }", context="a")
+
+        assert_that(len(fetches), equal_to(2))
+
+    def test_operations_in_same_document_are_cached_separately(self):
+        execute, fetches = self._create_executor()
+        query = """
+            query Names { authors { name } }
+            query Writers { writers: authors { name } }
+        """
+
+        execute(query, operation_name="Names")
+        result = execute(query, operation_name="Writers")
+
+        assert_that(result, is_successful_result(data={"writers": [{"name": "PG Wodehouse"}]}))
+        assert_that(len(fetches), equal_to(2))
+
+    def test_queries_against_different_schemas_are_cached_separately(self):
+        execute, _ = self._create_executor()
+        schema_whitelist = parse_schema("""
+            schema {
+                query: Root
+            }
+
+            type Root {
+                authors: [Author!]!
+            }
+
+            type Author {
+                name: String
+            }
+        """)
+        query = "{ __schema { types { name fields { name } } } }"
+
+        execute(query)
+        result = execute(query, schema=schema_whitelist)
+
+        author_type, = [type_ for type_ in result.data["__schema"]["types"] if type_["name"] == "Author"]
+        assert_that(author_type["fields"], equal_to([{"name": "name"}]))
+
+    def test_mutating_result_does_not_change_cached_result(self):
+        execute, _ = self._create_executor()
+
+        execute("{ authors { name } }").data["authors"].append(None)
+        execute("{ authors { name } }").data["authors"].append(None)
+        result = execute("{ authors { name } }")
+
+        assert_that(result, is_successful_result(data={"authors": [{"name": "PG Wodehouse"}]}))
+
+    def _create_executor(self, **kwargs):
+        AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+        fetches = []
+
+        class Author(ObjectType):
+            id = field(type=Int)
+            name = field(type=String)
+
+            @staticmethod
+            def __select_all__():
+                return [AuthorRecord(1, "PG Wodehouse")]
+
+            @staticmethod
+            def __fetch_immediates__(selections, records, context):
+                fetches.append(selections)
+                return [
+                    tuple(getattr(record, selection.field.attr_name) for selection in selections)
+                    for record in records
+                ]
+
+        class Root(RootType):
+            authors = many(lambda: select(Author))
+
+        execute = executor(Root, response_cache=InMemoryCache(max_size=10), **kwargs)
+        return execute, fetches
+
+
+class TestDocumentCache(object):
+    def test_documents_are_parsed_once(self, monkeypatch):
+        parses = []
+        parse = graphjoiner.parse
+        monkeypatch.setattr(graphjoiner, "parse", lambda query: parses.append(query) or parse(query))
+        execute = self._create_executor()
+        query = """
+            query Names { authors { name } }
+            query Writers { writers: authors { name } }
+        """
+
+        first = execute(query, operation_name="Names")
+        second = execute(query, operation_name="Writers")
+
+        assert_that(first, is_successful_result(data={"authors": [{"name": "PG Wodehouse"}]}))
+        assert_that(second, is_successful_result(data={"writers": [{"name": "PG Wodehouse"}]}))
+        assert_that(len(parses), equal_to(1))
+
+    def test_invalid_documents_are_cached_with_validation_errors(self):
+        execute = self._create_executor()
+
+        execute("{ authors { title } }")
+        result = execute("{ authors { title } }")
+
+        assert_that(result, is_invalid_result(errors=contains(
+            has_string(starts_with('Cannot query field "title"')),
+        )))
+
+    def _create_executor(self):
+        AuthorRecord = attr.make_class("AuthorRecord", ["name"])
+
+        class Author(ObjectType):
+            name = field(type=String)
+
+            @staticmethod
+            def __select_all__():
+                return [AuthorRecord("PG Wodehouse")]
+
+            @staticmethod
+            def __fetch_immediates__(selections, records, context):
+                return [
+                    tuple(getattr(record, selection.field.attr_name) for selection in selections)
+                    for record in records
+                ]
+
+        class Root(RootType):
+            authors = many(lambda: select(Author))
+
+        return executor(Root, document_cache=InMemoryCache(max_size=10))
+
+
+class TestEntityCache(object):
+    def test_cached_entities_are_not_fetched_again(self):
+        execute, queries = self._create_executor()
+
+        execute("{ authors { id name } }")
+        result = execute("{ authors { id name } }")
+
+        assert_that(result, is_successful_result(data={
+            "authors": [{"id": 1, "name": "PG Wodehouse"}, {"id": 2, "name": "Joseph Heller"}],
+        }))
+        assert_that(queries, equal_to([
+            ("all", ["id"]),
+            ("keys", [1, 2], ["id", "name"]),
+            ("all", ["id"]),
+        ]))
+
+    def test_only_entities_missing_from_cache_are_fetched(self):
+        execute, queries = self._create_executor()
+
+        execute("{ author(id: 1) { name } }")
+        result = execute("{ authors { name } }")
+
+        assert_that(result, is_successful_result(data={
+            "authors": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}],
+        }))
+        assert_that(queries[-1], equal_to(("keys", [2], ["id", "name"])))
+
+    def test_entities_are_fetched_again_when_new_fields_are_requested(self):
+        execute, queries = self._create_executor()
+
+        execute("{ authors { id } }")
+        result = execute("{ authors { name } }")
+
+        assert_that(result, is_successful_result(data={
+            "authors": [{"name": "PG Wodehouse"}, {"name": "Joseph Heller"}],
+        }))
+        assert_that(queries[-1], equal_to(("keys", [1, 2], ["id", "name"])))
+
+    def test_invalidated_entities_are_fetched_again(self):
+        execute, queries = self._create_executor()
+
+        execute("{ authors { name } }")
+        self._Author.__graphjoiner__.invalidate_entities([(2, )])
+        execute("{ authors { name } }")
+
+        assert_that(queries[-1], equal_to(("keys", [2], ["id", "name"])))
+
+    def _create_executor(self):
+        AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+        records = [AuthorRecord(1, "PG Wodehouse"), AuthorRecord(2, "Joseph Heller")]
+        queries = []
+
+        class Author(ObjectType):
+            __entity_cache__ = InMemoryCache(max_size=10)
+            __entity_key__ = ("id", )
+
+            id = field(type=Int)
+            name = field(type=String)
+
+            @staticmethod
+            def __select_all__():
+                return ("all", records)
+
+            @staticmethod
+            def __select_by_keys__(fields, keys, context):
+                ids = [author_id for author_id, in keys]
+                return ("keys", ids, [record for record in records if record.id in ids])
+
+            @staticmethod
+            def __fetch_immediates__(selections, query, context):
+                selected = [selection.field.attr_name for selection in selections]
+                queries.append(query[:-1] + (selected, ))
+                return [
+                    tuple(getattr(record, attr_name) for attr_name in selected)
+                    for record in query[-1]
+                ]
+
+        class Root(RootType):
+            authors = many(lambda: select(Author))
+            author = single_or_null(lambda: select(Author))
+
+            @author.arg("id", Int)
+            def author_id(query, author_id):
+                return query[:-1] + ([record for record in query[-1] if record.id == author_id], )
+
+        self._Author = Author
+        return executor(Root), queries
@@ -0,0 +1,177 @@
+import attr
+from hamcrest import assert_that, contains, equal_to, has_string
+import pytest
+from sqlalchemy import Column, Integer, Unicode
+from sqlalchemy.ext.declarative import declarative_base
+
+from graphjoiner.declarative import executor, field, Int, many, ObjectType, RootType, select, single, String
+from graphjoiner.declarative.sqlalchemy import column_field, keyset_connection, SqlAlchemyObjectType
+from .matchers import is_invalid_result, is_successful_result
+
+
+def test_query_within_limits_is_executed():
+    execute, _ = _create_executor(max_cost=31, max_depth=3)
+
+    result = execute("{ books { title author { name } } }")
+
+    assert_that(result, is_successful_result(data={
+        "books": [{"title": "Leave It to Psmith", "author": {"name": "PG Wodehouse"}}],
+    }))
+
+
+def test_query_exceeding_max_depth_is_rejected_before_fetching():
+    execute, fetches = _create_executor(max_depth=2)
+
+    result = execute("{ books { author { name } } }")
+
+    assert_that(result, is_invalid_result(errors=contains(
+        has_string("Query has depth of 3 which exceeds maximum depth of 2"),
+    )))
+    assert_that(fetches, equal_to([]))
+
+
+def test_cost_of_list_selections_is_multiplied_by_default_list_size():
+    # books (1) + 10 * (title (1) + author (1) + name (1))
+    execute, fetches = _create_executor(max_cost=30, default_list_size=10)
+
+    result = execute("{ books { title author { name } } }")
+
+    assert_that(result, is_invalid_result(errors=contains(
+        has_string("Query has cost of 31 which exceeds maximum cost of 30"),
+    )))
+    assert_that(fetches, equal_to([]))
+
+
+def test_cost_of_list_selections_is_multiplied_by_first_argument():
+    execute, _ = _create_executor(max_cost=10, default_list_size=10)
+
+    result = execute("{ books(first: 3) { title author { name } } }")
+
+    assert_that(result, is_successful_result(data={
+        "books": [{"title": "Leave It to Psmith", "author": {"name": "PG Wodehouse"}}],
+    }))
+
+
+def test_negative_first_argument_does_not_reduce_cost():
+    # books (1) + 0 * title (1) + books (1) + summary (10)
+    execute, fetches = _create_executor(max_cost=11, default_list_size=1)
+
+    result = execute("{ books(first: -5) { title } summaries: books { summary } }")
+
+    assert_that(result, is_invalid_result(errors=contains(
+        has_string("Query has cost of 12 which exceeds maximum cost of 11"),
+    )))
+    assert_that(fetches, equal_to([]))
+
+
+@pytest.mark.parametrize("query, cost", [
+    # books (1) + edges (1) + 100 * (node (1) + title (1))
+    ("{ books(first: 100) { edges { node { title } } } }", 202),
+    # books (1) + edges (1) + 20 * (node (1) + title (1))
+    ("{ books { edges { node { title } } } }", 42),
+])
+def test_edges_of_keyset_connection_are_multiplied_by_page_size(query, cost):
+    Base = declarative_base()
+
+    class BookRecord(Base):
+        __tablename__ = "book"
+
+        c_id = Column(Integer, primary_key=True)
+        c_title = Column(Unicode, nullable=False)
+
+    class Book(SqlAlchemyObjectType):
+        __model__ = BookRecord
+
+        id = column_field(BookRecord.c_id)
+        title = column_field(BookRecord.c_title)
+
+    class Root(RootType):
+        books = keyset_connection(lambda: Book, order_by=[BookRecord.c_id], default_page_size=20)
+
+    result = executor(Root, max_cost=1, default_list_size=10)(query)
+
+    assert_that(result, is_invalid_result(errors=contains(
+        has_string("Query has cost of {} which exceeds maximum cost of 1".format(cost)),
+    )))
+
+
+def test_fields_can_set_cost():
+    execute, _ = _create_executor(max_cost=10, default_list_size=1)
+
+    assert_that(execute("{ books { title } }"), is_successful_result(data={
+        "books": [{"title": "Leave It to Psmith"}],
+    }))
+    assert_that(execute("{ books { summary } }"), is_invalid_result(errors=contains(
+        has_string("Query has cost of 11 which exceeds maximum cost of 10"),
+    )))
+
+
+def test_request_is_aborted_when_fetch_exceeds_max_rows_per_fetch():
+    execute, _ = _create_executor(max_rows_per_fetch=1, books=3)
+
+    result = execute("{ books { title } }")
+
+    assert_that(result, is_invalid_result(errors=contains(
+        has_string("Fetch exceeded maximum of 1 rows"),
+    )))
+
+
+def test_request_is_aborted_when_rows_across_fetches_exceed_max_rows():
+    execute, _ = _create_executor(max_rows=3, books=3)
+
+    assert_that(execute("{ books { title } }"), is_successful_result(data={
+        "books": [{"title": "Leave It to Psmith"}] * 3,
+    }))
+    assert_that(execute("{ books { author { name } } }"), is_invalid_result(errors=contains(
+        has_string("Request exceeded maximum of 3 rows"),
+    )))
+
+
+def test_rows_are_not_fetched_after_limit_is_exceeded():
+    execute, fetched_rows = _create_executor(max_rows=2, books=10)
+
+    execute("{ books { title } }")
+
+    assert_that(fetched_rows, equal_to(["Book", "Book", "Book"]))
+
+
+def _create_executor(books=1, **kwargs):
+    AuthorRecord = attr.make_class("AuthorRecord", ["id", "name"])
+    BookRecord = attr.make_class("BookRecord", ["title", "summary", "author_id"])
+    fetched_rows = []
+
+    class StaticDataObjectType(ObjectType):
+        __abstract__ = True
+
+        @classmethod
+        def __select_all__(cls):
+            return cls.__records__
+
+        @classmethod
+        def __fetch_immediates__(cls, selections, records, context):
+            for record in records:
+                fetched_rows.append(cls.__name__)
+                yield tuple(getattr(record, selection.field.attr_name) for selection in selections)
+
+    class Author(StaticDataObjectType):
+        __records__ = [AuthorRecord(1, "PG Wodehouse")]
+
+        id = field(type=Int)
+        name = field(type=String)
+
+    class Book(StaticDataObjectType):
+        __records__ = [BookRecord("Leave It to Psmith", "Psmith poses as a poet.", 1)] * books
+
+        title = field(type=String)
+        summary = field(type=String, cost=10)
+        author_id = field(type=Int)
+        author = single(lambda: select(Author, join_fields={Book.author_id: Author.id}))
+
+    class Root(RootType):
+        books = many(lambda: select(Book))
+
+        @books.arg("first", Int)
+        def books_arg_first(records, first):
+            return records[:first]
+
+    return executor(Root, **kwargs), fetched_rows
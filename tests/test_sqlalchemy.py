@@ -1,7 +1,8 @@
 from __future__ import unicode_literals
 
 from graphql import GraphQLInt, GraphQLString
-from hamcrest import assert_that
+from hamcrest import assert_that, equal_to
+import sqlalchemy
 from sqlalchemy import create_engine, Column, Integer, Unicode, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session
@@ -87,7 +88,7 @@ class Root(RootType):
         return query.filter(AuthorRecord.c_id == author_id)
 
 
-def execute(query, **kwargs):
+def execute(query, statements=None, **kwargs):
     engine = create_engine("sqlite:///:memory:")
 
     Base.metadata.create_all(engine)
@@ -101,6 +102,11 @@ def execute(query, **kwargs):
 
     session.commit()
 
+    if statements is not None:
+        @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
     execute = executor(Root)
 
     class Api(object):
@@ -144,3 +150,28 @@ def test_can_join_across_types():
             },
         },
     }))
+
+
+def test_value_joins_are_built_from_fetched_parents_without_querying():
+    statements = []
+    query = """
+        {
+            books {
+                title
+                sales {
+                    quantity
+                }
+            }
+        }
+    """
+
+    result = execute(query, statements=statements)
+
+    assert_that(result, is_successful_result(data={
+        "books": [
+            {"title": "Leave It to Psmith", "sales": {"quantity": 416}},
+            {"title": "Right Ho, Jeeves", "sales": {"quantity": 44}},
+            {"title": "Catch-22", "sales": {"quantity": 53}},
+        ],
+    }))
+    assert_that(len(statements), equal_to(1))